@@ -5,17 +5,18 @@ Streamlit app for LinkedIn Post Generator (3 posts, card layout, usage & moderat
 
 import streamlit as st
 import json
-from src.agents.planner import plan
-from src.agents.writer import generate_post
-from src.utils.moderation import moderate_post
-from src.llm_providers import chat
-from src.utils.cost import estimate_cost
-from src.utils.text import clean_text
-from dotenv import load_dotenv
-load_dotenv()
-import os
-print("GOOGLE_API_KEY:", os.getenv("GOOGLE_API_KEY"))
-print("HF_API_KEY:", os.getenv("HF_API_KEY"))
+from src.agents.graph import run_pipeline
+from src import health
+from src.config import settings
+from src.utils import metrics
+from src.utils.cache import make_key
+
+# Prometheus /metrics and health probes for this process (METRICS_PORT, HEALTH_PORT);
+# each server is started once, not per rerun
+if settings.metrics_port:
+    metrics.start_http_server(settings.metrics_port)
+if settings.health_port:
+    health.start_server(settings.health_port)
 
 
 st.set_page_config(
@@ -73,33 +74,43 @@ st.markdown("<br>", unsafe_allow_html=True)
 
 
 # --- Generate ---
+# Kept across reruns: results by plan, and the last output of each pipeline
+# stage so only the stages whose inputs changed are recomputed
+if "results" not in st.session_state:
+    st.session_state.results = {}
+    st.session_state.memo = {}
+
+# Build plan dict
+plan_data = {
+    "tone": tone,
+    "audience": audience,
+    "length": length,
+    "outline": outline,
+    "use_news": use_news,
+    "keywords": [k.strip() for k in keywords.split(",") if k.strip()],
+    "cta": cta,
+}
+plan_key = make_key(topic=topic, plan=plan_data)
+
 if st.button("🚀 Generate Posts"):
     with st.spinner("Generating your LinkedIn posts..."):
-
-        # Build plan dict
-        plan_data = {
-            "tone": tone,
-            "audience": audience,
-            "length": length,
-            "outline": outline,
-            "use_news": use_news,
-            "keywords": [k.strip() for k in keywords.split(",") if k.strip()],
-            "cta": cta,
-        }
-
-        # Generate 3 posts
-        posts_data = []
-        usage_data = {"input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0, "model": ""}
-        for _ in range(3):
-            post_result = generate_post(plan_data)
-            posts_data.append(clean_text(post_result.get("post", "")))
-
-            # Aggregate usage and cost
-            if "cost" in post_result:
-                usage_data = post_result["cost"]
-
-        # Run moderation on each post
-        moderation_results = [moderate_post({"post": p}) for p in posts_data]
+        # Generate 3 posts concurrently, then moderate them together.
+        # Pressing Generate again for the same inputs asks for new variants.
+        st.session_state.results[plan_key] = run_pipeline(
+            topic, tone, audience, length,
+            overrides=plan_data, use_planner=False, n=3, memo=st.session_state.memo,
+            fresh=plan_key in st.session_state.results,
+            # Hashtags aren't shown here, so don't pay for them
+            with_hashtags=False,
+        )
+        while len(st.session_state.results) > 10:
+            st.session_state.results.pop(next(iter(st.session_state.results)))
+
+result = st.session_state.results.get(plan_key)
+if result is not None:
+    posts_data = result["drafts"]
+    moderation_results = result["final"]
+    usage_data = result["usage"]
 
     st.subheader("✍️ Generated Posts")
 
@@ -159,3 +170,6 @@ if st.button("🚀 Generate Posts"):
 
     st.subheader("📊 Usage & Cost")
     st.json(usage_data)
+
+    st.subheader("⏱️ Stage Timings")
+    st.json(result["timings"])
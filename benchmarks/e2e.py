@@ -0,0 +1,275 @@
+# benchmarks/e2e.py
+"""
+End-to-end benchmark of the generation pipeline against the local mock LLM
+server (benchmarks/mock_server.py), so no quota is spent.
+
+Scenarios:
+- main:     the main.py flow (local plan, 3 streamed variants, moderation, hashtags)
+- pipeline: graph.run_pipeline with the planner LLM, no streaming
+- batch:    src.batch over a generated JSONL file
+
+Reports p50/p95/p99 request latency, throughput, and LLM calls and tokens per
+request; results are written as JSON so runs can be compared across versions.
+
+    python -m benchmarks.e2e --requests 30 --concurrency 4 --latency-ms 300 --out bench.json
+    python -m benchmarks.e2e --scenarios pipeline --baseline bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.mock_server import MockConfig, MockServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TOPICS = [
+    "AI in marketing", "Remote team rituals", "Data contracts", "Hiring junior engineers",
+    "Product-led growth", "Observability budgets", "Customer interviews", "Pricing experiments",
+]
+
+
+def _configure(url: str, rpm: float) -> None:
+    """
+    Points the app at the mock server before any setting is read.
+    """
+    os.environ.update({
+        "MODEL_NAME": "openai/mock-model",
+        "LLM_API_BASE": f"{url}/v1",
+        "GEMINI_API_BASE": url,
+        "GEMINI_API_KEY": "mock",
+        "LLM_FALLBACK_MODELS": "",
+        "LLM_RPM": str(rpm),
+        "LLM_CACHE": "false",
+        "HISTORY_ENABLED": "false",
+        "NEWS_API_KEY": "",
+        # Don't fetch LiteLLM's remote price list on import
+        "LITELLM_LOCAL_MODEL_COST_MAP": "True",
+    })
+    from src.config import settings
+    settings.reload()
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 4),
+        "p50": round(pick(0.50), 4),
+        "p95": round(pick(0.95), 4),
+        "p99": round(pick(0.99), 4),
+        "max": round(ordered[-1], 4),
+    }
+
+
+def _topic(i: int) -> str:
+    # Distinct topics, so in-process caches don't flatter later requests
+    return f"{TOPICS[i % len(TOPICS)]} #{i}"
+
+
+# --- scenarios: each returns one pipeline result per request ---
+
+def _main_flow(i: int) -> Dict:
+    from src.agents.graph import run_pipeline
+
+    topic = _topic(i)
+    plan_data = {
+        "topic": topic, "tone": "Professional", "audience": "Professionals", "length": "Short",
+        "outline": ["Hook", "Key Insight", "CTA"], "use_news": False,
+        "keywords": ["AI", "Marketing"], "cta": "If this resonated, share your thoughts below!",
+    }
+    return run_pipeline(
+        topic, "Professional", "Professionals", "Short",
+        overrides=plan_data, use_planner=False, n=3, on_delta=lambda i, text: None,
+    )
+
+
+def _pipeline(i: int) -> Dict:
+    from src.agents.graph import run_pipeline
+
+    return run_pipeline(_topic(i), "Professional", "Professionals", "Medium", use_planner=True, n=3)
+
+
+def _run_requests(fn: Callable[[int], Dict], requests: int, concurrency: int, start: int = 0) -> Dict:
+    latencies: List[float] = []
+    results: List[Dict] = []
+    errors: List[str] = []
+
+    def one(i: int) -> None:
+        started = time.perf_counter()
+        try:
+            results.append(fn(i))
+        except Exception as e:
+            errors.append(str(e))
+            return
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(start, start + requests)))
+    return {"wall": time.perf_counter() - started, "latencies": latencies, "results": results, "errors": errors}
+
+
+def _run_batch(requests: int, concurrency: int, start: int = 0) -> Dict:
+    from src.batch import run_batch
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, "in.jsonl")
+        output_path = os.path.join(tmp, "out.jsonl")
+        with open(input_path, "w", encoding="utf-8") as f:
+            for i in range(start, start + requests):
+                f.write(json.dumps({"id": f"req-{i}", "topic": _topic(i)}) + "\n")
+
+        started = time.perf_counter()
+        counts = asyncio.run(run_batch(input_path, output_path, concurrency=concurrency, variants=3))
+        wall = time.perf_counter() - started
+
+        with open(output_path, encoding="utf-8") as f:
+            results = [json.loads(line) for line in f if line.strip()]
+
+    return {
+        "wall": wall,
+        "latencies": [r["timings"]["total"]["seconds"] for r in results],
+        "results": results,
+        "errors": ["failed"] * counts["failed"],
+    }
+
+
+SCENARIOS = {
+    "main": lambda n, c, start=0: _run_requests(_main_flow, n, c, start),
+    "pipeline": lambda n, c, start=0: _run_requests(_pipeline, n, c, start),
+    "batch": lambda n, c, start=0: _run_batch(n, c, start),
+}
+
+
+def run_scenario(name: str, server: MockServer, requests: int, concurrency: int, warmup: int = 1,
+                 start: int = 0) -> Dict:
+    """
+    Topics start at `start`; give each scenario its own range so in-process
+    caches (e.g. the plan cache) filled by one don't flatter the next.
+    """
+    if warmup:
+        # Imports, client setup and connection pools shouldn't count as request latency;
+        # warm-up topics come after the measured ones so no cache is pre-filled for them
+        SCENARIOS[name](warmup, 1, start=start + requests)
+    server.stats.reset()
+    run = SCENARIOS[name](requests, concurrency, start=start)
+    served = server.stats.snapshot()
+
+    totals = [r["usage"]["total"] for r in run["results"]]
+    done = max(1, len(totals))
+    report = {
+        "scenario": name,
+        "requests": requests,
+        "concurrency": concurrency,
+        "succeeded": len(run["results"]),
+        "errors": len(run["errors"]),
+        "wall_seconds": round(run["wall"], 3),
+        "throughput_rps": round(len(run["results"]) / run["wall"], 3) if run["wall"] else 0.0,
+        "latency_seconds": _percentiles(run["latencies"]),
+        "per_request": {
+            "llm_calls": round(sum(t["calls"] for t in totals) / done, 2),
+            "input_tokens": round(sum(t["input_tokens"] for t in totals) / done, 1),
+            "output_tokens": round(sum(t["output_tokens"] for t in totals) / done, 1),
+            # Server-side view, including retried and failed attempts
+            "server_calls": round(served["calls"] / done, 2),
+        },
+        "server": served,
+    }
+    if run["errors"]:
+        report["sample_errors"] = sorted(set(run["errors"]))[:5]
+    return report
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print(report: Dict, baseline: Optional[Dict]) -> None:
+    lat = report["latency_seconds"]
+    per = report["per_request"]
+    line = (
+        f"{report['scenario']:<9} {report['succeeded']}/{report['requests']} ok  "
+        f"p50 {lat.get('p50', 0):.3f}s  p95 {lat.get('p95', 0):.3f}s  p99 {lat.get('p99', 0):.3f}s  "
+        f"{report['throughput_rps']:.2f} req/s  "
+        f"{per['llm_calls']} calls, {per['input_tokens']:.0f} in / {per['output_tokens']:.0f} out tokens per request"
+    )
+    print(line)
+    if baseline and baseline.get("latency_seconds", {}).get("p50"):
+        before = baseline["latency_seconds"]
+        deltas = [
+            f"{q} {100 * (lat[q] - before[q]) / before[q]:+.1f}%"
+            for q in ("p50", "p95", "p99") if before.get(q) and q in lat
+        ]
+        print(f"{'':<9} vs baseline: " + "  ".join(deltas))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline against a local mock LLM server.")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=20, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=4, help="requests in flight at once")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed requests before each scenario")
+    parser.add_argument("--rpm", type=float, default=100_000, help="client-side rate limit (LLM_RPM)")
+    parser.add_argument("--latency-ms", type=float, default=MockConfig.latency_ms)
+    parser.add_argument("--latency-sigma", type=float, default=MockConfig.latency_sigma)
+    parser.add_argument("--tokens-per-second", type=float, default=MockConfig.tokens_per_second)
+    parser.add_argument("--error-rate", type=float, default=MockConfig.error_rate)
+    parser.add_argument("--throttle-rate", type=float, default=MockConfig.throttle_rate)
+    parser.add_argument("--post-words", type=int, default=MockConfig.post_words)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    config = MockConfig(
+        latency_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+        tokens_per_second=args.tokens_per_second, error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate, post_words=args.post_words, seed=args.seed,
+    )
+
+    baseline: Dict[str, Dict] = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = {r["scenario"]: r for r in json.load(f).get("scenarios", [])}
+
+    reports = []
+    with MockServer(config) as server:
+        _configure(server.url, args.rpm)
+        for k, name in enumerate(args.scenarios):
+            start = k * (args.requests + args.warmup)
+            report = run_scenario(name, server, args.requests, args.concurrency, args.warmup, start)
+            reports.append(report)
+            _print(report, baseline.get(name))
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({
+                "revision": _git_revision(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": sys.version.split()[0],
+                "mock": asdict(config),
+                "scenarios": reports,
+            }, f, indent=2)
+
+    return 1 if any(r["errors"] for r in reports) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
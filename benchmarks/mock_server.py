@@ -0,0 +1,356 @@
+# benchmarks/mock_server.py
+"""
+Local stand-in for the LLM providers, so the pipeline can be benchmarked
+without spending quota. Speaks just enough of two wire formats:
+
+- OpenAI chat completions (POST .../chat/completions, JSON or SSE streaming),
+  used through LiteLLM with MODEL_NAME=openai/<anything> and LLM_API_BASE=<url>/v1
+- Gemini generateContent (POST .../models/<model>:generateContent), used by the
+  moderation client with GEMINI_API_BASE=<url>
+
+Replies are shaped by the system prompt (planner JSON, hashtag, moderation and
+post-variant arrays, otherwise a random post), so every stage parses them like real output.
+
+    python -m benchmarks.mock_server --port 8900 --latency-ms 400 --error-rate 0.02
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+WORDS = (
+    "growth teams data insight customers product launch learning strategy market leaders "
+    "automation trust results experiment feedback scale quality culture pipeline revenue "
+    "story lesson impact workflow hiring network brand velocity focus clarity signal"
+).split()
+
+
+@dataclass
+class MockConfig:
+    # Response latency: lognormal around the median (sigma 0 = fixed)
+    latency_ms: float = 300.0
+    latency_sigma: float = 0.4
+    # Streaming speed once the first token is out
+    tokens_per_second: float = 80.0
+    # Share of requests answered with 500, and with 429 (+ Retry-After)
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    # Length of generated posts
+    post_words: int = 120
+    seed: Optional[int] = None
+
+
+class MockStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls = 0
+            self.errors = 0
+            self.throttled = 0
+            self.streams = 0
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+
+    def add(self, **amounts: int) -> None:
+        with self._lock:
+            for name, amount in amounts.items():
+                setattr(self, name, getattr(self, name) + amount)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "throttled": self.throttled,
+                "streams": self.streams,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+            }
+
+
+def _tokens(text: str) -> int:
+    return max(1, (len(text) + 3) // 4)
+
+
+def _json_items(text: str) -> List[Any]:
+    try:
+        data = json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        return []
+    return data if isinstance(data, list) else []
+
+
+def reply_for(system: str, user: str, rng: random.Random, post_words: int) -> str:
+    """
+    A plausible reply for whichever agent sent the prompt.
+    """
+    system = system.lower()
+    if "planning agent" in system:
+        return json.dumps({
+            "tone": "professional", "audience": "professionals", "length": "medium",
+            "outline": ["Hook", "Key Insight", "Example", "CTA"], "use_news": False,
+            "keywords": rng.sample(WORDS, 4), "cta": "Share your thoughts below!",
+        })
+    if "hashtag" in system:
+        tags = lambda: " ".join("#" + w.capitalize() for w in rng.sample(WORDS, 6))
+        if "json array" in system:
+            return json.dumps([tags() for _ in (_json_items(user) or [None])])
+        return tags()
+    if "moderation classifier" in system:
+        if "json array" in system:
+            return json.dumps(["SAFE" for _ in (_json_items(user) or [None])])
+        return "SAFE"
+    if "moderation agent" in system:
+        # SAFE posts come back unchanged
+        return json.dumps(_json_items(user)) if "json array" in system else user
+    post = lambda: " ".join(rng.choice(WORDS) for _ in range(post_words)).capitalize() + "."
+    variants = re.search(r"json array of exactly (\d+)", system)
+    if variants:
+        # Writer asking for several variants in one reply
+        return json.dumps([post() for _ in range(int(variants.group(1)))])
+    return post()
+
+
+class MockServer:
+    def __init__(self, config: MockConfig, host: str = "127.0.0.1", port: int = 0):
+        self.config = config
+        self.stats = MockStats()
+        self._rng = random.Random(config.seed)
+        self._rng_lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "MockServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    # --- behaviour ---
+
+    def _draw(self) -> Tuple[float, Optional[int], random.Random]:
+        """
+        (latency seconds, error status or None, per-request RNG) for one request.
+        """
+        c = self.config
+        with self._rng_lock:
+            latency = c.latency_ms / 1000 * (self._rng.lognormvariate(0, c.latency_sigma) if c.latency_sigma else 1)
+            roll = self._rng.random()
+            rng = random.Random(self._rng.random())
+        if roll < c.throttle_rate:
+            return latency, 429, rng
+        if roll < c.throttle_rate + c.error_rate:
+            return latency, 500, rng
+        return latency, None, rng
+
+    def _decode_seconds(self, replies: List[str]) -> float:
+        """
+        Generation time after the first token, as the streaming path paces it:
+        one word per token at tokens_per_second. Choices decode in parallel.
+        """
+        tps = self.config.tokens_per_second
+        if tps <= 0:
+            return 0.0
+        return max(len(r.split(" ")) for r in replies) / tps
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def _send_json(self, status: int, body: Dict, headers: Optional[Dict] = None) -> None:
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self) -> None:
+                if self.path.rstrip("/") in ("/health", "/v1/models"):
+                    self._send_json(200, {"status": "ok", "stats": server.stats.snapshot()})
+                else:
+                    self._send_json(404, {"error": {"message": "not found"}})
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError:
+                    self._send_json(400, {"error": {"message": "invalid JSON"}})
+                    return
+
+                path = self.path.split("?")[0]
+                if path.endswith("/chat/completions"):
+                    self._openai(body)
+                elif ":generateContent" in path:
+                    self._gemini(body, path)
+                else:
+                    self._send_json(404, {"error": {"message": f"unknown path {path}"}})
+
+            def _fail(self, status: int, latency: float) -> None:
+                time.sleep(latency / 4)
+                if status == 429:
+                    server.stats.add(calls=1, throttled=1)
+                    self._send_json(429, {"error": {"message": "rate limited", "type": "rate_limit_error", "code": 429}},
+                                    {"Retry-After": "1"})
+                else:
+                    server.stats.add(calls=1, errors=1)
+                    self._send_json(500, {"error": {"message": "mock failure", "type": "server_error", "code": 500}})
+
+            def _openai(self, body: Dict) -> None:
+                latency, status, rng = server._draw()
+                if status:
+                    self._fail(status, latency)
+                    return
+
+                messages = body.get("messages") or []
+                system = " ".join(str(m.get("content", "")) for m in messages if m.get("role") == "system")
+                user = str(messages[-1].get("content", "")) if messages else ""
+                prompt_tokens = sum(_tokens(str(m.get("content", ""))) for m in messages)
+                n = int(body.get("n") or 1)
+                replies = [reply_for(system, user, rng, server.config.post_words) for _ in range(n)]
+                completion_tokens = sum(_tokens(r) for r in replies)
+                server.stats.add(calls=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+                model = body.get("model", "mock")
+                if body.get("stream"):
+                    server.stats.add(streams=1)
+                    self._stream(model, replies[0], latency)
+                    return
+
+                time.sleep(latency + server._decode_seconds(replies))
+                self._send_json(200, {
+                    "id": f"chatcmpl-{rng.getrandbits(48):x}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {"index": i, "message": {"role": "assistant", "content": r}, "finish_reason": "stop"}
+                        for i, r in enumerate(replies)
+                    ],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    },
+                })
+
+            def _stream(self, model: str, reply: str, latency: float) -> None:
+                # First token after the sampled latency, then tokens_per_second
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+
+                time.sleep(latency)
+                delay = 1.0 / server.config.tokens_per_second if server.config.tokens_per_second > 0 else 0
+                words = reply.split(" ")
+                for i, word in enumerate(words):
+                    chunk = {
+                        "id": "chatcmpl-mock", "object": "chat.completion.chunk", "model": model,
+                        "choices": [{"index": 0, "delta": {"content": word + (" " if i < len(words) - 1 else "")},
+                                     "finish_reason": None}],
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    if delay:
+                        time.sleep(delay)
+                done = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "model": model,
+                        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                self.wfile.write(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            def _gemini(self, body: Dict, path: str) -> None:
+                latency, status, rng = server._draw()
+                if status:
+                    self._fail(status, latency)
+                    return
+
+                system = " ".join(
+                    p.get("text", "") for p in ((body.get("systemInstruction") or {}).get("parts") or [])
+                )
+                texts = [p.get("text", "") for c in body.get("contents") or [] for p in c.get("parts") or []]
+                user = texts[-1] if texts else ""
+                reply = reply_for(system, user, rng, server.config.post_words)
+                prompt_tokens = _tokens(system) + sum(_tokens(t) for t in texts)
+                completion_tokens = _tokens(reply)
+                server.stats.add(calls=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+                time.sleep(latency + server._decode_seconds([reply]))
+                self._send_json(200, {
+                    "candidates": [{
+                        "content": {"role": "model", "parts": [{"text": reply}]},
+                        "finishReason": "STOP",
+                        "index": 0,
+                    }],
+                    "usageMetadata": {
+                        "promptTokenCount": prompt_tokens,
+                        "candidatesTokenCount": completion_tokens,
+                        "totalTokenCount": prompt_tokens + completion_tokens,
+                    },
+                })
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a mock OpenAI/Gemini-compatible LLM server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=MockConfig.latency_ms)
+    parser.add_argument("--latency-sigma", type=float, default=MockConfig.latency_sigma)
+    parser.add_argument("--tokens-per-second", type=float, default=MockConfig.tokens_per_second)
+    parser.add_argument("--error-rate", type=float, default=MockConfig.error_rate)
+    parser.add_argument("--throttle-rate", type=float, default=MockConfig.throttle_rate)
+    parser.add_argument("--post-words", type=int, default=MockConfig.post_words)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        latency_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+        tokens_per_second=args.tokens_per_second, error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate, post_words=args.post_words, seed=args.seed,
+    )
+    server = MockServer(config, args.host, args.port)
+    print(f"mock LLM server on {server.url}  (LLM_API_BASE={server.url}/v1, GEMINI_API_BASE={server.url})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# benchmarks/startup.py
+"""
+Import-time benchmark for the project's entry points.
+
+Each entry point is imported in a fresh interpreter (repeated --runs times)
+so module caches don't hide cold-start cost. Reports the median wall time,
+the slowest modules from `python -X importtime`, and whether any heavy SDK
+was loaded eagerly.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 10 --json startup.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = [
+    "src.config",
+    "src.llm_providers",
+    "src.utils.moderation",
+    "src.agents.graph",
+    "src.batch",
+]
+
+# Modules that must only be imported on first use
+HEAVY_MODULES = ["streamlit", "litellm", "google.generativeai", "tiktoken"]
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def _run(module: str) -> Dict:
+    code = _PROBE.format(module=module, heavy=HEAVY_MODULES)
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _slowest(module: str, top: int) -> List[Dict]:
+    """
+    The `top` modules with the largest cumulative import time (-X importtime).
+    """
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append({"module": name.strip(), "cumulative_ms": int(cumulative) / 1000})
+    rows.sort(key=lambda r: r["cumulative_ms"], reverse=True)
+    return rows[:top]
+
+
+def measure(module: str, runs: int = 5, top: int = 5) -> Dict:
+    samples = [_run(module) for _ in range(runs)]
+    seconds = [s["seconds"] for s in samples]
+    return {
+        "module": module,
+        "runs": runs,
+        "median_ms": round(statistics.median(seconds) * 1000, 2),
+        "min_ms": round(min(seconds) * 1000, 2),
+        "max_ms": round(max(seconds) * 1000, 2),
+        "heavy_loaded": samples[-1]["loaded"],
+        "slowest": _slowest(module, top),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure import time of each entry point.")
+    parser.add_argument("modules", nargs="*", default=ENTRY_POINTS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5, help="slowest modules to list per entry point")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for module in args.modules:
+        try:
+            result = measure(module, args.runs, args.top)
+        except subprocess.CalledProcessError as e:
+            print(f"{module:<24} failed to import:\n{e.stderr.strip()}", file=sys.stderr)
+            continue
+        results.append(result)
+
+        heavy = ", ".join(result["heavy_loaded"]) or "-"
+        print(f"{module:<24} median {result['median_ms']:>8.1f} ms   eager SDKs: {heavy}")
+        for row in result["slowest"]:
+            print(f"    {row['cumulative_ms']:>8.1f} ms  {row['module']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
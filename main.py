@@ -7,12 +7,11 @@ import json
 import os
 
 # Local imports
-from src.agents.writer import generate_post
-from src.utils.moderation import moderate_post
-from src.llm_providers import chat
-from src.utils.cost import estimate_cost
-from src.utils.text import clean_text
-from src.agents.hashtags import generate_hashtags
+from src.agents.graph import run_pipeline
+from src import health
+from src.config import settings
+from src.utils import metrics
+from src.utils.cache import make_key
 
 # --- Streamlit Page Config ---
 st.set_page_config(
@@ -21,6 +20,13 @@ st.set_page_config(
     layout="wide",
 )
 
+# Prometheus /metrics and health probes for this process (METRICS_PORT, HEALTH_PORT);
+# each server is started once, not per rerun
+if settings.metrics_port:
+    metrics.start_http_server(settings.metrics_port)
+if settings.health_port:
+    health.start_server(settings.health_port)
+
 # --- Secrets Handling ---
 # ✅ Safely load from .streamlit/secrets.toml
 MODEL_NAME = st.secrets.get("MODEL_NAME", "gemini-1.5-flash")
@@ -87,91 +93,132 @@ st.markdown("<br>", unsafe_allow_html=True)
 
 
 # --- Generate ---
-if st.button("🚀 Generate Posts"):
-    with st.spinner("Generating your LinkedIn posts..."):
-
-        # Plan dict passed into writer
-        plan_data = {
-            "topic": topic,
-            "tone": tone,
-            "audience": audience,
-            "length": length,
-            "outline": outline,
-            "use_news": use_news,
-            "keywords": [k.strip() for k in keywords.split(",") if k.strip()],
-            "cta": cta,
-        }
-
-        posts_data = []
-        usage_data = {"input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0, "model": ""}
-
-        for _ in range(3):
-            post_result = generate_post(plan_data)
-            posts_data.append(clean_text(post_result.get("post", "")))
-
-            if "cost" in post_result:
-                usage_data = post_result["cost"]
-
-        # Moderation pass
-        moderation_results = [moderate_post(p) for p in posts_data]
+CARD_CSS = """
+    <style>
+    .post-card {
+        background-color: #1e1e1e;
+        color: #f0f0f0;
+        border-radius: 12px;
+        padding: 15px;
+        margin: 5px;
+        box-shadow: 0 4px 12px rgba(0,0,0,0.3);
+        position: relative;
+        font-family: monospace;
+    }
+    .post-card h4 {
+        margin-top: 0;
+        color: #F63366;
+    }
+    .post-card pre {
+        background-color: #2b2b2b;
+        padding: 10px;
+        border-radius: 8px;
+        overflow-x: auto;
+        max-height: 300px;
+    }
+    .copy-btn {
+        position: absolute;
+        top: 10px;
+        right: 10px;
+        background-color: #ffd700;
+        color: #000;
+        border: none;
+        padding: 5px 10px;
+        border-radius: 5px;
+        cursor: pointer;
+        font-size: 12px;
+    }
+    </style>
+"""
+
+# Results survive reruns (any widget interaction re-executes this script):
+# each pipeline result is kept under its plan, and `memo` holds the last
+# output of every stage so a changed input only recomputes what depends on it.
+MAX_RESULTS = 10
+
+if "results" not in st.session_state:
+    st.session_state.results = {}
+    st.session_state.memo = {}
+    st.session_state.last_key = None
+
+
+def render_card(placeholder, i: int, post_text: str, hashtags: str = "") -> None:
+    post_html = post_text.replace("\n", "<br>")
+    placeholder.markdown(
+        f"""
+        <div class="post-card">
+            <h4>Post {i+1}</h4>
+            <div id="post-{i}">{post_html}</div>
+            <div id="post-{i}">{hashtags}</div>
+        </div>
+        """,
+        unsafe_allow_html=True,
+    )
 
-    st.subheader("✍️ Generated Posts")
 
-    # --- CSS for Cards ---
-    st.markdown("""
-        <style>
-        .post-card {
-            background-color: #1e1e1e;
-            color: #f0f0f0;
-            border-radius: 12px;
-            padding: 15px;
-            margin: 5px;
-            box-shadow: 0 4px 12px rgba(0,0,0,0.3);
-            position: relative;
-            font-family: monospace;
-        }
-        .post-card h4 {
-            margin-top: 0;
-            color: #F63366;
-        }
-        .post-card pre {
-            background-color: #2b2b2b;
-            padding: 10px;
-            border-radius: 8px;
-            overflow-x: auto;
-            max-height: 300px;
-        }
-        .copy-btn {
-            position: absolute;
-            top: 10px;
-            right: 10px;
-            background-color: #ffd700;
-            color: #000;
-            border: none;
-            padding: 5px 10px;
-            border-radius: 5px;
-            cursor: pointer;
-            font-size: 12px;
-        }
-        </style>
-    """, unsafe_allow_html=True)
+# Plan dict passed into writer
+plan_data = {
+    "topic": topic,
+    "tone": tone,
+    "audience": audience,
+    "length": length,
+    "outline": outline,
+    "use_news": use_news,
+    "keywords": [k.strip() for k in keywords.split(",") if k.strip()],
+    "cta": cta,
+}
+plan_key = make_key(plan=plan_data)
+
+btn1, btn2, _ = st.columns([1, 1, 4])
+generate = btn1.button("🚀 Generate Posts")
+regenerate = btn2.button("🔄 Regenerate", disabled=st.session_state.last_key is None)
+
+results = st.session_state.results
+shown_key = plan_key if plan_key in results else st.session_state.last_key
+
+if generate or regenerate or shown_key is not None:
+    st.subheader("✍️ Generated Posts")
+    st.markdown(CARD_CSS, unsafe_allow_html=True)
 
     # --- 3-column layout for cards ---
     cols = st.columns(3)
-    for i, (col, post, moderation) in enumerate(zip(cols, posts_data, moderation_results)):
-        with col:
-            # Ensure post text is safe (moderation already applied)
-            post_text = moderation if isinstance(moderation, str) else str(moderation)
-            post_html = post_text.replace("\n", "<br>")
-            hashtags = generate_hashtags(post_text)
-
-            st.markdown(
-                f"""
-                <div class="post-card">
-                    <h4>Post {i+1}</h4>
-                    <div id="post-{i}">{post_html}</div>
-                    <div id="post-{i}">{hashtags}</div>
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
\ No newline at end of file
+    placeholders = [col.empty() for col in cols]
+
+    if generate or regenerate:
+        # Stream the 3 variants concurrently, each into its own card;
+        # moderation and hashtags then run side by side on the drafts
+        result = run_pipeline(
+            topic, tone, audience, length,
+            overrides=plan_data,
+            use_planner=False,
+            n=len(placeholders),
+            on_delta=lambda i, text: render_card(placeholders[i], i, text),
+            memo=st.session_state.memo,
+            # Regenerate: fresh variants for the same plan; plan and news are still reused
+            fresh=regenerate,
+        )
+
+        results.pop(plan_key, None)
+        results[plan_key] = result
+        while len(results) > MAX_RESULTS:
+            results.pop(next(iter(results)))
+        st.session_state.last_key = shown_key = plan_key
+    else:
+        result = results[shown_key]
+        if shown_key != plan_key:
+            st.info("Inputs changed since these posts were generated. Press Generate to update them.")
+
+    for i, (placeholder, moderation, hashtags) in enumerate(zip(placeholders, result["final"], result["hashtags"])):
+        # Ensure post text is safe (moderation already applied)
+        post_text = moderation if isinstance(moderation, str) else str(moderation)
+        render_card(placeholder, i, post_text, hashtags)
+
+    with st.expander("⏱️ Stage timings"):
+        st.json(result["timings"])
+
+    with st.expander("📊 Usage & Cost"):
+        st.json(result["usage"])
+
+    ttft = metrics.summary("llm_ttft_seconds")
+    if ttft["count"]:
+        st.caption(f"⚡ Time to first token: p50 {ttft['p50']:.2f}s over {ttft['count']} calls")
@@ -1,11 +1,33 @@
 import streamlit as st
 from PIL import Image
 
+from src.health import get_checker
+
 st.set_page_config(page_title="Health Check", page_icon="✅", layout="wide")
 
-# Minimal "I'm alive" response
-image = Image.open('pages/IMG_1853.jpg')
-image = image.rotate(-90)
-st.write("Staus OK 200")
-st.write("I am alive")
-st.image(image, caption="Everything seems to be fine")
+# Load balancers should probe src/health.py (/healthz, /readyz) instead of this page.
+
+
+@st.cache_resource
+def load_image() -> Image.Image:
+    # Decoded, rotated and downscaled once per process instead of on every hit
+    image = Image.open("pages/IMG_1853.jpg")
+    image.draft("RGB", (800, 800))
+    image = image.rotate(-90, expand=True)
+    image.thumbnail((800, 800))
+    return image
+
+
+# Cached snapshot from the background checks; rendering it does no work
+snapshot = get_checker().snapshot()
+
+if snapshot["ready"]:
+    st.write("Staus OK 200")
+    st.write("I am alive")
+else:
+    st.write(f"Status: {snapshot['status']}")
+
+st.image(load_image(), caption="Everything seems to be fine" if snapshot["ready"] else snapshot["status"])
+
+with st.expander("Readiness checks"):
+    st.json(snapshot)
@@ -0,0 +1,54 @@
+import streamlit as st
+from datetime import datetime
+
+from src.utils.history import get_store
+
+st.set_page_config(page_title="History", page_icon="🗂️", layout="wide")
+
+st.title("🗂️ Generation History")
+st.write("Search past posts and reuse one instead of generating a new one.")
+
+store = get_store()
+if store is None:
+    st.info("History is disabled (HISTORY_ENABLED=false, or its database couldn't be opened).")
+    st.stop()
+
+query = st.text_input("🔎 Search posts, hashtags or topics", placeholder="e.g. marketing automation")
+page_size = st.select_slider("Results per page", options=[10, 20, 50], value=20)
+
+# Keyset paging for browsing, offset paging for ranked search results
+if "history_cursor" not in st.session_state or st.session_state.get("history_query") != query:
+    st.session_state.history_cursor = []
+    st.session_state.history_query = query
+
+page = len(st.session_state.history_cursor)
+if query.strip():
+    rows = store.search(query, limit=page_size, offset=page * page_size)
+else:
+    before = st.session_state.history_cursor[-1] if page else None
+    rows = store.recent(limit=page_size, before_id=before)
+
+if not rows:
+    st.write("No posts found.")
+
+for row in rows:
+    created = datetime.fromtimestamp(row["created"]).strftime("%Y-%m-%d %H:%M")
+    with st.expander(f"{row['topic'] or 'Untitled'} — variant {row['variant'] + 1} · {created}"):
+        if row.get("snippet"):
+            st.markdown(row["snippet"])
+        # st.code has a built-in copy button, which makes reuse one click
+        st.code(row["text"], language=None)
+        if row["hashtags"]:
+            st.caption(row["hashtags"])
+        if st.button("Show full run", key=f"run-{row['id']}"):
+            st.json(store.get_run(row["run_id"]))
+
+col_prev, col_next = st.columns(2)
+with col_prev:
+    if page and st.button("⬅️ Newer"):
+        st.session_state.history_cursor.pop()
+        st.rerun()
+with col_next:
+    if len(rows) == page_size and st.button("Older ➡️"):
+        st.session_state.history_cursor.append(rows[-1]["id"])
+        st.rerun()
@@ -0,0 +1,113 @@
+# src/agents/diversity.py
+"""
+Near-duplicate detection among post variants. Only the variants that are too
+similar to an earlier one are regenerated, with a hint to take another angle.
+"""
+
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from rapidfuzz import fuzz
+
+from src.agents import writer
+from src.config import settings
+from src.utils import metrics
+from src.utils.text import clean_text
+
+logger = logging.getLogger(__name__)
+
+# How much of each sibling post goes into the "don't repeat" hint
+HINT_CHARS = 160
+
+
+def similarity(a: str, b: str) -> float:
+    """
+    0-100 similarity that ignores word order and case.
+    """
+    return fuzz.token_sort_ratio(a, b, processor=str.lower)
+
+
+def pairwise(posts: List[str]) -> Dict[Tuple[int, int], float]:
+    return {
+        (i, j): similarity(posts[i], posts[j])
+        for i in range(len(posts))
+        for j in range(i + 1, len(posts))
+    }
+
+
+def find_duplicates(posts: List[str], threshold: float) -> List[int]:
+    """
+    Indices of variants scoring above `threshold` against an earlier kept variant.
+    The earliest of each near-duplicate group is kept.
+    """
+    scores = pairwise(posts)
+    duplicates: List[int] = []
+    for j in range(len(posts)):
+        if any(scores[(i, j)] > threshold for i in range(j) if i not in duplicates):
+            duplicates.append(j)
+    return duplicates
+
+
+def _hint(posts: List[str], index: int) -> str:
+    openings = [
+        p.strip().replace("\n", " ")[:HINT_CHARS]
+        for i, p in enumerate(posts)
+        if i != index and p.strip()
+    ]
+    return (
+        "Write a clearly different variant: use a different hook, structure and example "
+        "than these existing posts, which start: " + " | ".join(openings)
+    )
+
+
+async def diversify(
+    plan: Dict,
+    posts: List[str],
+    news: Optional[List[Dict]] = None,
+    threshold: Optional[float] = None,
+    max_rounds: Optional[int] = None,
+    use_cache: bool = True,
+) -> Tuple[List[str], Dict]:
+    """
+    Regenerates near-duplicate variants until all pairs are below `threshold`
+    or `max_rounds` regeneration rounds have run (bounding the extra latency).
+    use_cache=False skips the response cache for the regenerated variants.
+    Returns (posts, report) with the final pairwise scores and what was regenerated.
+    """
+    threshold = settings.diversity_threshold if threshold is None else threshold
+    max_rounds = settings.diversity_max_rounds if max_rounds is None else max_rounds
+    posts = list(posts)
+    regenerated: List[int] = []
+    rounds = 0
+
+    while rounds < max_rounds:
+        duplicates = find_duplicates(posts, threshold)
+        if not duplicates:
+            break
+        rounds += 1
+
+        async def redo(i: int) -> str:
+            hinted = {**plan, "diversity_hint": _hint(posts, i)}
+            result = await writer.agenerate_post(hinted, variant=i, news=news, use_cache=use_cache)
+            return clean_text(result.get("post", ""))
+
+        # A failed regeneration keeps the original variant rather than failing the run
+        fresh = await asyncio.gather(*(redo(i) for i in duplicates), return_exceptions=True)
+        for i, text in zip(duplicates, fresh):
+            if isinstance(text, BaseException):
+                metrics.incr("diversity_regeneration_errors")
+                logger.warning("Regenerating variant %d failed: %s", i, text)
+            elif text:
+                posts[i] = text
+                regenerated.append(i)
+
+    scores = pairwise(posts)
+    report = {
+        "threshold": threshold,
+        "rounds": rounds,
+        "regenerated": sorted(set(regenerated)),
+        "max_similarity": max(scores.values(), default=0.0),
+        "scores": {f"{i}-{j}": round(s, 1) for (i, j), s in scores.items()},
+    }
+    return posts, report
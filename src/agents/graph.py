@@ -1,30 +1,283 @@
 # src/agents/graph.py
 
-from src.agents import planner, writer, guardrails, tools
+import asyncio
+import inspect
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-def run_pipeline(topic: str, tone: str, audience: str, length: str) -> dict:
+from src.agents import planner, writer, guardrails, tools, hashtags, diversity
+from src.config import settings
+from src.utils import cost, history, metrics, tracing
+from src.utils.cache import make_key
+from src.utils.moderation import cached_verdict
+from src.utils.text import clean_text
+
+logger = logging.getLogger(__name__)
+
+# Stages that depend on the drafts; a fresh run recomputes them for the same plan
+DRAFT_STAGES = ("drafts", "variety", "moderation", "hashtags")
+
+
+@dataclass
+class Stage:
+    """
+    One node of the pipeline graph.
+    `fn` receives the outputs of `deps` as keyword arguments (by stage name)
+    and may be sync (run in a worker thread) or async.
+    `inputs` lists anything besides the deps that changes its output (see execute's memo).
+    """
+    name: str
+    fn: Callable[..., Any]
+    deps: Tuple[str, ...] = ()
+    inputs: Any = None
+
+
+async def execute(
+    stages: List[Stage],
+    memo: Optional[Dict[str, Tuple[str, Any]]] = None,
+) -> Tuple[Dict[str, Any], Dict[str, Dict[str, float]]]:
+    """
+    Runs every stage as soon as its dependencies are done, so independent
+    stages overlap. Returns (outputs by stage name, timings by stage name),
+    where each timing is {"start": offset_seconds, "seconds": duration}.
+    The first failing stage cancels the rest and its error is raised.
+
+    With a `memo` dict (kept by the caller between runs), a stage whose inputs
+    and dependency outputs are identical to its last run is not executed again:
+    its previous output is reused and its timing is marked {"reused": True}.
+    """
+    by_name = {s.name: s for s in stages}
+    for s in stages:
+        missing = [d for d in s.deps if d not in by_name]
+        if missing:
+            raise ValueError(f"Stage '{s.name}' depends on unknown stages: {missing}")
+
+    origin = time.perf_counter()
+    tasks: Dict[str, asyncio.Task] = {}
+    timings: Dict[str, Dict[str, float]] = {}
+
+    async def run(stage: Stage) -> Any:
+        inputs = {d: await tasks[d] for d in stage.deps}
+        started = time.perf_counter()
+
+        key = None
+        if memo is not None:
+            key = make_key(stage=stage.name, inputs=stage.inputs, deps=inputs)
+            previous = memo.get(stage.name)
+            if previous is not None and previous[0] == key:
+                timings[stage.name] = {"start": round(started - origin, 4), "seconds": 0.0, "reused": True}
+                return previous[1]
+
+        try:
+            # LLM usage inside the stage is booked under its name
+            with cost.stage(stage.name), tracing.span(f"stage.{stage.name}"):
+                if inspect.iscoroutinefunction(stage.fn):
+                    output = await stage.fn(**inputs)
+                else:
+                    output = await asyncio.to_thread(stage.fn, **inputs)
+            if key is not None:
+                memo[stage.name] = (key, output)
+            return output
+        finally:
+            seconds = time.perf_counter() - started
+            metrics.observe("pipeline_stage_seconds", seconds, stage=stage.name)
+            timings[stage.name] = {"start": round(started - origin, 4), "seconds": round(seconds, 4)}
+
+    for s in stages:
+        tasks[s.name] = asyncio.create_task(run(s), name=s.name)
+
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for t in tasks.values():
+            t.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+
+    ordered = {s.name: timings[s.name] for s in stages}
+    ordered["total"] = {"start": 0.0, "seconds": round(time.perf_counter() - origin, 4)}
+    return {name: t.result() for name, t in tasks.items()}, ordered
+
+
+def build_stages(
+    topic: str,
+    tone: str,
+    audience: str,
+    length: str,
+    *,
+    overrides: Optional[Dict] = None,
+    use_planner: bool = True,
+    n: int = 3,
+    on_delta: Optional[Callable[[int, str], Any]] = None,
+    fresh: bool = False,
+    with_hashtags: bool = True,
+) -> List[Stage]:
     """
-    Orchestrates the workflow:
-    planner -> optional news -> writer -> guardrail
-    Returns structured output with intermediate steps.
+    The post-generation graph: plan and news_prefetch start together, news keeps the
+    prefetched articles only if the plan asks for them, drafts waits for both,
+    variety regenerates near-duplicate drafts, then moderation and hashtags run
+    side by side.
+
+    `overrides` are explicit user choices (outline, keywords, cta, use_news, ...) laid
+    over the plan. With use_planner=False the plan is built locally, without an LLM call.
+    `on_delta(i, text_so_far)` streams variant i while it's being written.
+    With fresh=True the writer skips the response cache, so the same plan gets new drafts.
+    with_hashtags=False leaves out the hashtags stage (an LLM call) for callers that don't show them.
     """
-    # Step 1: Planner
-    plan = planner.plan(topic, tone, audience, length)
+    overrides = overrides or {}
+
+    def plan() -> Dict:
+        base = (
+            planner.plan(topic, tone, audience, length)
+            if use_planner
+            else planner.default_plan(topic, tone, audience, length)
+        )
+        return {**base, **overrides, "topic": topic}
+
+    speculate = bool(settings.news_api_key) and overrides.get("use_news", use_planner) is not False
+
+    def news_prefetch() -> List[Dict]:
+        return tools.get_recent_news(topic, limit=3) if speculate else []
+
+    def news(plan: Dict, news_prefetch: List[Dict]) -> List[Dict]:
+        return news_prefetch if plan.get("use_news") else []
+
+    async def drafts(plan: Dict, news: List[Dict]) -> List[str]:
+        if on_delta is None:
+            results = await writer.generate_posts(plan, n, news=news, use_cache=not fresh)
+            return [clean_text(r.get("post", "")) for r in results]
+
+        async def one(i: int) -> str:
+            text = ""
+            async for delta in writer.astream_post(plan, variant=i, news=news, use_cache=not fresh):
+                text += delta
+                on_delta(i, text)
+            return clean_text(text)
+
+        return list(await asyncio.gather(*(one(i) for i in range(n))))
+
+    async def variety(plan: Dict, news: List[Dict], drafts: List[str]) -> Dict:
+        posts, report = await diversity.diversify(plan, drafts, news=news, use_cache=not fresh)
+        if on_delta is not None:
+            for i in report["regenerated"]:
+                on_delta(i, posts[i])
+        return {"posts": posts, "report": report}
+
+    def moderation(variety: Dict) -> List[str]:
+        return guardrails.guard_all(variety["posts"])
 
-    # Step 2: Optional news tool
-    news = []
-    if plan.get("use_news"):
-        news = tools.get_recent_news(topic, limit=3)
+    def tags(plan: Dict, variety: Dict) -> List[str]:
+        if settings.low_latency:
+            return [hashtags.extract_hashtags(d, plan.get("keywords")) for d in variety["posts"]]
+        return hashtags.generate_hashtags_batch(variety["posts"])
 
-    # Step 3: Writer
-    draft = writer.write(plan, news=news)
+    stages = [
+        Stage("plan", plan, inputs=(topic, tone, audience, length, overrides, use_planner)),
+        Stage("news_prefetch", news_prefetch, inputs=(topic, speculate)),
+        Stage("news", news, ("plan", "news_prefetch")),
+        Stage("drafts", drafts, ("plan", "news"), inputs=n),
+        Stage("variety", variety, ("plan", "news", "drafts")),
+        Stage("moderation", moderation, ("variety",)),
+    ]
+    if with_hashtags:
+        stages.append(Stage("hashtags", tags, ("plan", "variety"), inputs=settings.low_latency))
+    return stages
 
-    # Step 4: Guardrail
-    safe_text = guardrails.guard(draft)
 
-    return {
-        "plan": plan,
-        "news": news,
-        "draft": draft,
-        "final": safe_text,
+async def arun_pipeline(
+    topic: str,
+    tone: str,
+    audience: str,
+    length: str,
+    *,
+    overrides: Optional[Dict] = None,
+    use_planner: bool = True,
+    n: int = 3,
+    on_delta: Optional[Callable[[int, str], Any]] = None,
+    memo: Optional[Dict[str, Tuple[str, Any]]] = None,
+    fresh: bool = False,
+    with_hashtags: bool = True,
+) -> Dict:
+    """
+    Async variant of run_pipeline().
+    """
+    if fresh and memo is not None:
+        for name in DRAFT_STAGES:
+            memo.pop(name, None)
+
+    with cost.track(cost.UsageLedger()) as ledger, tracing.span("pipeline", topic=topic) as root:
+        try:
+            outputs, timings = await execute(
+                build_stages(
+                    topic, tone, audience, length,
+                    overrides=overrides, use_planner=use_planner, n=n, on_delta=on_delta,
+                    fresh=fresh, with_hashtags=with_hashtags,
+                ),
+                memo=memo,
+            )
+        except Exception:
+            metrics.incr("pipeline_errors")
+            raise
+    metrics.observe("pipeline_seconds", timings["total"]["seconds"])
+
+    result = {
+        "plan": outputs["plan"],
+        "news": outputs["news"],
+        "drafts": outputs["variety"]["posts"],
+        "diversity": outputs["variety"]["report"],
+        "final": outputs["moderation"],
+        "hashtags": outputs.get("hashtags", []),
+        "timings": timings,
+        "usage": ledger.summary(),
+        "request_id": root.trace_id,
     }
+    result["verdicts"] = [cached_verdict(d) for d in result["drafts"]]
+
+    # Queued for the background writer; never blocks the response.
+    # A fully reused run generated nothing new, so it isn't recorded twice.
+    if not all(t.get("reused") for name, t in timings.items() if name != "total"):
+        try:
+            history.record_run(topic, result, result["verdicts"])
+        except Exception as e:
+            # History is best effort; a finished (and paid for) run is still returned
+            logger.warning("Recording run in history failed: %s", e)
+    return result
+
+
+def run_pipeline(
+    topic: str,
+    tone: str,
+    audience: str,
+    length: str,
+    *,
+    overrides: Optional[Dict] = None,
+    use_planner: bool = True,
+    n: int = 3,
+    on_delta: Optional[Callable[[int, str], Any]] = None,
+    memo: Optional[Dict[str, Tuple[str, Any]]] = None,
+    fresh: bool = False,
+    with_hashtags: bool = True,
+) -> Dict:
+    """
+    Orchestrates the workflow as a dependency graph:
+    planner (+ speculative news) -> writer (n variants) -> guardrail + hashtags
+    Returns structured output with intermediate steps, per-stage timings and
+    token/cost usage:
+    {"plan", "news", "drafts", "diversity", "final", "verdicts", "hashtags", "timings", "usage", "request_id"}
+    (request_id is the trace ID when tracing is on, otherwise None).
+
+    Pass the same `memo` dict across calls (e.g. from UI session state) to
+    recompute only the stages whose inputs changed since the previous call;
+    fresh=True regenerates the drafts (and what depends on them) for the same
+    inputs, bypassing both the memo and the response cache.
+    With with_hashtags=False no hashtags are generated and "hashtags" is [].
+    """
+    return asyncio.run(
+        arun_pipeline(
+            topic, tone, audience, length,
+            overrides=overrides, use_planner=use_planner, n=n, on_delta=on_delta, memo=memo,
+            fresh=fresh, with_hashtags=with_hashtags,
+        )
+    )
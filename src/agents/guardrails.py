@@ -1,11 +1,21 @@
 # src/agents/guardrail.py
 
-from src.utils.moderation import moderate_post
+from typing import List
+
+from src.utils.moderation import moderate_post, moderate_posts
 
 def guard(text: str) -> str:
     """
     Runs moderation checks on the text.
     Always returns only the final LinkedIn post text,
     or 'Not Safe to post' if unsafe.
+    Uses the verdict-only protocol, so safe text is never regenerated.
     """
     return moderate_post(text)
+
+
+def guard_all(texts: List[str]) -> List[str]:
+    """
+    Batched guard() for several posts; one result per input, in order.
+    """
+    return moderate_posts(texts)
@@ -1,4 +1,13 @@
+import hashlib
+import json
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional
+
 from src.llm_providers import chat
+from src.utils import tracing
+from src.utils.text import parse_json
 
 HASHTAG_SYS = """
 You are a hashtag generator for LinkedIn posts.
@@ -10,11 +19,62 @@ Rules:
 Example: #AI #Marketing #LinkedIn
 """
 
+HASHTAG_BATCH_SYS = """
+You are a hashtag generator for LinkedIn posts.
+You receive a JSON array of LinkedIn posts. For each post, produce 5-10 optimized hashtags.
+Rules:
+- Use only relevant hashtags.
+- No numbering, no explanations.
+- Return only a JSON array of strings with one entry per input post, in the same order.
+- Each entry is a single line of hashtags separated by spaces, e.g. "#AI #Marketing #LinkedIn".
+"""
+
+# Hashtag strings kept in memory, keyed by a hash of the post text
+HASHTAG_CACHE_SIZE = 1024
+
+_STOPWORDS = {
+    "a", "about", "after", "all", "also", "an", "and", "any", "are", "as", "at", "be", "because",
+    "been", "but", "by", "can", "could", "do", "does", "for", "from", "get", "has", "have", "how",
+    "if", "in", "into", "is", "it", "its", "just", "let", "like", "more", "most", "my", "new", "not",
+    "now", "of", "on", "one", "or", "our", "out", "own", "so", "some", "than", "that", "the", "their",
+    "them", "then", "there", "these", "they", "this", "those", "to", "up", "us", "was", "we", "were",
+    "what", "when", "where", "which", "while", "who", "why", "will", "with", "would", "you", "your",
+}
+
+_cache: "OrderedDict[str, str]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _key(post_text: str) -> str:
+    return hashlib.sha256(post_text.strip().encode("utf-8")).hexdigest()
+
+
+def _cache_get(post_text: str) -> Optional[str]:
+    with _cache_lock:
+        key = _key(post_text)
+        tags = _cache.get(key)
+        if tags is not None:
+            _cache.move_to_end(key)
+        return tags
+
+
+def _cache_put(post_text: str, tags: str) -> None:
+    with _cache_lock:
+        _cache[_key(post_text)] = tags
+        while len(_cache) > HASHTAG_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+@tracing.traced("hashtags.generate")
 def generate_hashtags(post_text: str) -> str:
     """
     Generate hashtags for a LinkedIn post using the LLM.
     Returns a plain text string like: "#AI #Marketing #Business"
     """
+    cached = _cache_get(post_text)
+    if cached is not None:
+        return cached
+
     prompt = [
         {"role": "system", "content": HASHTAG_SYS},
         {"role": "user", "content": post_text},
@@ -24,4 +84,89 @@ def generate_hashtags(post_text: str) -> str:
     raw = r.get("content", "").strip()
 
     # Just return the hashtags as plain text
+    _cache_put(post_text, raw)
     return raw
+
+
+@tracing.traced("hashtags.batch")
+def generate_hashtags_batch(posts: List[str]) -> List[str]:
+    """
+    Generate hashtags for several posts with a single LLM call.
+    Cached posts are skipped; posts the batched reply doesn't cover (or all
+    of them, if it can't be matched back) get one call each.
+    Returns one hashtag string per post, in order.
+    """
+    pending = list(dict.fromkeys(p for p in posts if _cache_get(p) is None))
+
+    if len(pending) == 1:
+        generate_hashtags(pending[0])
+    elif pending:
+        prompt = [
+            {"role": "system", "content": HASHTAG_BATCH_SYS},
+            {"role": "user", "content": json.dumps(pending)},
+        ]
+
+        raw = chat(prompt).get("content", "")
+        items = parse_json(raw, list, source="hashtags", keep_partial=False) or []
+
+        # Keep whatever lines up (a cut-off reply still covers its first posts);
+        # a longer or malformed list can't be matched back, so nothing is kept
+        if len(items) <= len(pending) and all(isinstance(i, str) for i in items):
+            for post_text, tags in zip(pending, items):
+                if tags.strip():
+                    _cache_put(post_text, tags.strip())
+
+    return [_cache_get(p) or generate_hashtags(p) for p in posts]
+
+
+def _to_hashtag(phrase: str) -> str:
+    words = re.findall(r"[A-Za-z0-9]+", phrase)
+    tag = "".join(w if w.isupper() else w[:1].upper() + w[1:] for w in words)
+    return f"#{tag}" if tag and not tag.isdigit() else ""
+
+
+def extract_hashtags(post_text: str, keywords: Optional[List[str]] = None, limit: int = 8) -> str:
+    """
+    Build hashtags locally, without an LLM call: the plan's keywords first,
+    then the most frequent non-stopword unigrams and bigrams of the post.
+    Returns the same single-line format as generate_hashtags().
+    """
+    tags: Dict[str, str] = {}
+
+    def add(phrase: str) -> None:
+        tag = _to_hashtag(phrase)
+        if tag and tag.lower() not in tags:
+            tags[tag.lower()] = tag
+
+    for kw in keywords or []:
+        add(kw)
+
+    unigrams: Counter = Counter()
+    bigrams: Counter = Counter()
+    display: Dict[str, str] = {}
+
+    # Work clause by clause so bigrams never span sentence boundaries
+    for clause in re.split(r"[.,;:!?()\n]+", post_text):
+        words = re.findall(r"[A-Za-z][A-Za-z0-9'-]+", clause)
+        lowered = [w.lower() for w in words]
+
+        for i, w in enumerate(lowered):
+            if w in _STOPWORDS or len(w) < 4:
+                continue
+            display.setdefault(w, words[i])
+            unigrams[w] += 1
+            if i + 1 < len(lowered) and lowered[i + 1] not in _STOPWORDS and len(lowered[i + 1]) >= 3:
+                pair = f"{w} {lowered[i + 1]}"
+                display.setdefault(pair, f"{words[i]} {words[i + 1]}")
+                bigrams[pair] += 1
+
+    # Repeated bigrams are the most specific signal, then frequent single words
+    candidates = [(phrase, 2 * n) for phrase, n in bigrams.items() if n > 1]
+    candidates += list(unigrams.items())
+
+    for phrase, _ in sorted(candidates, key=lambda c: -c[1]):
+        if len(tags) >= limit:
+            break
+        add(display[phrase])
+
+    return " ".join(list(tags.values())[:limit])
@@ -1,5 +1,31 @@
-from typing import Dict
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from itertools import islice
+from typing import Dict, Optional, Set, Tuple
+
+from rapidfuzz import fuzz, process
+
+from src.config import settings
 from src.llm_providers import chat
+from src.utils import metrics
+from src.utils.prompt import truncate_tokens
+from src.utils.text import parse_json
+
+# Topics are free text; anything longer than this is cut before prompting
+TOPIC_TOKEN_LIMIT = 200
+
+# Words that don't change what a topic is about ("AI in marketing" == "AI for marketing")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from how in into is it of on or our the this to vs what why with your".split()
+)
+# Topics are indexed by the first few characters of each word, so a typo
+# later in a word still finds its neighbours; numbers are indexed whole and
+# must match exactly ("GPT-4" is not "GPT-5", "2023 trends" not "2024 trends")
+PREFIX_CHARS = 4
+# At most this many indexed topics are scored per lookup
+MAX_FUZZY_CANDIDATES = 256
 
 PLANNER_SYS = """
 You are a planning agent for LinkedIn posts.
@@ -15,38 +41,200 @@ Given a topic and user preferences, create a JSON plan with these keys:
 Return only valid compact JSON (no commentary).
 """
 
+# Structured-output schema for providers with a native JSON mode
+PLAN_SCHEMA = {
+    "title": "post_plan",
+    "type": "object",
+    "properties": {
+        "tone": {"type": "string"},
+        "audience": {"type": "string"},
+        "length": {"type": "string"},
+        "outline": {"type": "array", "items": {"type": "string"}},
+        "use_news": {"type": "boolean"},
+        "keywords": {"type": "array", "items": {"type": "string"}},
+        "cta": {"type": "string"},
+    },
+    "required": ["tone", "audience", "length", "outline", "use_news", "keywords", "cta"],
+}
+
+_TYPES = {"string": str, "array": list, "boolean": bool}
+
+_Bucket = Tuple[str, str, str]
+
+
+def normalize_topic(topic: str) -> str:
+    """
+    Case-, punctuation- and word-order-insensitive form of a topic.
+    """
+    words = re.findall(r"[^\W_]+", unicodedata.normalize("NFKC", topic or "").casefold())
+    kept = [w for w in words if w not in STOPWORDS] or words
+    return " ".join(sorted(set(kept)))
+
 
-def plan(topic: str, tone: str, audience: str, length: str) -> Dict:
+class PlanCache:
+    """
+    Bounded LRU of plans keyed by (tone, audience, length) and normalized
+    topic. A topic without an exact entry takes the closest one in its bucket
+    scoring at least `threshold` (0-100, rapidfuzz ratio) and containing
+    exactly the same numbers. Candidates come from the rarest shared word
+    prefixes, at most MAX_FUZZY_CANDIDATES per lookup, which keeps lookups
+    under a millisecond at tens of thousands of entries.
+    """
+
+    def __init__(self, max_size: int, threshold: float):
+        self.max_size = max_size
+        self.threshold = threshold
+        self._entries: "OrderedDict[Tuple[_Bucket, str], Dict]" = OrderedDict()
+        self._index: Dict[Tuple[_Bucket, str], Set[str]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bucket(tone: str, audience: str, length: str) -> _Bucket:
+        return (tone.strip().lower(), audience.strip().lower(), length.strip().lower())
+
+    @staticmethod
+    def _numbers(key: str) -> Set[str]:
+        return {w for w in key.split() if any(ch.isdigit() for ch in w)}
+
+    @staticmethod
+    def _terms(key: str) -> Set[str]:
+        return {w if any(ch.isdigit() for ch in w) else w[:PREFIX_CHARS] for w in key.split()}
+
+    def _nearest(self, bucket: _Bucket, key: str) -> Optional[str]:
+        numbers = self._numbers(key)
+        postings = [self._index.get((bucket, t), set()) for t in self._terms(key) if t not in numbers]
+        postings = sorted((p for p in postings if p), key=len)
+
+        if numbers:
+            # Only topics with exactly these numbers qualify
+            number_postings = [self._index.get((bucket, n), set()) for n in numbers]
+            candidates = set.intersection(*number_postings)
+        elif not postings:
+            return None
+        elif len(postings) > 1 and len(postings[0]) + len(postings[1]) <= MAX_FUZZY_CANDIDATES:
+            # The two rarest words, so a typo in one of them still matches
+            candidates = postings[0] | postings[1]
+        else:
+            candidates = postings.pop(0)
+
+        # Narrow crowded candidate sets by the next rarest word
+        for more in postings:
+            if len(candidates) <= MAX_FUZZY_CANDIDATES:
+                break
+            candidates = candidates & more
+        candidates = list(islice((c for c in candidates if self._numbers(c) == numbers), MAX_FUZZY_CANDIDATES))
+        if not candidates:
+            return None
+        match = process.extractOne(key, candidates, scorer=fuzz.ratio, score_cutoff=self.threshold)
+        return match[0] if match else None
+
+    def get(self, topic: str, tone: str, audience: str, length: str) -> Optional[Dict]:
+        bucket, key = self._bucket(tone, audience, length), normalize_topic(topic)
+        with self._lock:
+            kind = "exact"
+            if (bucket, key) not in self._entries:
+                kind, key = "fuzzy", self._nearest(bucket, key)
+            if key is None:
+                metrics.incr("plan_cache_misses")
+                return None
+            self._entries.move_to_end((bucket, key))
+            metrics.incr("plan_cache_hits", match=kind)
+            return dict(self._entries[(bucket, key)])
+
+    def put(self, topic: str, tone: str, audience: str, length: str, plan: Dict) -> None:
+        bucket, key = self._bucket(tone, audience, length), normalize_topic(topic)
+        with self._lock:
+            self._entries[(bucket, key)] = dict(plan)
+            self._entries.move_to_end((bucket, key))
+            for term in self._terms(key):
+                self._index.setdefault((bucket, term), set()).add(key)
+
+            while len(self._entries) > self.max_size:
+                (old_bucket, old_key), _ = self._entries.popitem(last=False)
+                for term in self._terms(old_key):
+                    keys = self._index.get((old_bucket, term))
+                    if keys is not None:
+                        keys.discard(old_key)
+                        if not keys:
+                            del self._index[(old_bucket, term)]
+                metrics.incr("plan_cache_evictions")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_cache: Optional[PlanCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_plan_cache() -> Optional[PlanCache]:
+    """
+    The process-wide plan cache, or None if PLAN_CACHE_SIZE is 0.
+    """
+    global _cache
+
+    if settings.plan_cache_size <= 0:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = PlanCache(settings.plan_cache_size, settings.plan_cache_threshold)
+        return _cache
+
+
+def plan(topic: str, tone: str, audience: str, length: str, cta: Optional[str] = None) -> Dict:
     """
     Generate a structured post plan.
-    Fallbacks to defaults if JSON parsing fails.
+    Missing or malformed fields fall back to default_plan(); the whole plan
+    does only if no JSON could be recovered from the reply.
+
+    Plans are reused for the same or a near-identical topic (PlanCache) with
+    the same tone, audience and length; the caller's tone, audience, length
+    and `cta` (if given) always win over the cached plan's.
     """
+    explicit = {"tone": tone, "audience": audience, "length": length}
+    if cta:
+        explicit["cta"] = cta
+
+    cache = get_plan_cache()
+    cached = cache.get(topic, tone, audience, length) if cache is not None else None
+    if cached is not None:
+        return {**cached, **explicit}
+
     prompt = [
         {"role": "system", "content": PLANNER_SYS},
         {
             "role": "user",
-            "content": f"Topic: {topic}\nTone: {tone}\nAudience: {audience}\nLength: {length}\n"
+            "content": f"Topic: {truncate_tokens(topic, TOPIC_TOKEN_LIMIT)}\nTone: {tone}\nAudience: {audience}\nLength: {length}\n"
                        "Output JSON only.",
         },
     ]
 
-    r = chat(prompt)
-    raw = r["content"]
-
-    import json
-
-    try:
-        data = json.loads(raw.strip())
-    except Exception:
-        # Default fallback plan
-        data = {
-            "tone": tone,
-            "audience": audience,
-            "length": length,
-            "outline": ["Hook", "Key Insight", "Supporting Example", "CTA"],
-            "use_news": False,
-            "keywords": [topic],
-            "cta": "If this resonated, share your thoughts below!",
-        }
-
-    return data
+    r = chat(prompt, json_schema=PLAN_SCHEMA)
+    data = parse_json(r["content"], dict, source="planner", keep_partial=False)
+    default = default_plan(topic, tone, audience, length)
+    if not data:
+        # Not cached, so the next request for this topic tries the LLM again
+        return {**default, **explicit}
+
+    # Keep every usable field of a partial or loosely typed plan
+    for key, spec in PLAN_SCHEMA["properties"].items():
+        if not isinstance(data.get(key), _TYPES[spec["type"]]) or data.get(key) in ("", []):
+            data[key] = default[key]
+    if cache is not None:
+        cache.put(topic, tone, audience, length, data)
+    return {**data, **explicit}
+
+
+def default_plan(topic: str, tone: str, audience: str, length: str) -> Dict:
+    """
+    Generic plan built from the user preferences alone, without an LLM call.
+    """
+    return {
+        "tone": tone,
+        "audience": audience,
+        "length": length,
+        "outline": ["Hook", "Key Insight", "Supporting Example", "CTA"],
+        "use_news": False,
+        "keywords": [topic],
+        "cta": "If this resonated, share your thoughts below!",
+    }
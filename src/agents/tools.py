@@ -1,41 +1,207 @@
-from typing import List, Dict
-import requests
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
+
 from src.config import settings
+from src.utils import metrics, tracing
 
-NEWS_URL = "https://newsapi.org/v2/everything"
+logger = logging.getLogger(__name__)
 
+# Queries kept in the cache at once
+NEWS_CACHE_SIZE = 256
 
-def get_recent_news(query: str, limit: int = 3) -> List[Dict]:
+
+class NewsError(RuntimeError):
+    pass
+
+
+class NewsClient:
     """
-    Fetch recent news articles related to the query using NewsAPI.
-    Requires NEWS_API_KEY in environment.
+    NewsAPI client with a pooled session, a TTL cache keyed by normalized query,
+    stale-while-revalidate and single-flight fetching:
 
-    Returns: list of dicts with keys: title, url, desc, source
+    - fresh entries (younger than `ttl`) are served from memory,
+    - stale entries (younger than `stale_ttl`) are served immediately while one
+      background fetch refreshes them,
+    - concurrent misses for the same query share a single HTTP request.
     """
-    if not settings.news_api_key:
-        return []
 
-    params = {
-        "q": query,
-        "sortBy": "publishedAt",
-        "language": "en",
-        "apiKey": settings.news_api_key,
-        "pageSize": limit,
-    }
+    def __init__(self, base_url: str, api_key: Optional[str], *,
+                 ttl: float = 600, stale_ttl: float = 3600, timeout: float = 10):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.timeout = timeout
 
-    try:
-        res = requests.get(NEWS_URL, params=params, timeout=10)
-        data = res.json()
+        # requests is imported with the first client, not with the module
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._cache: "OrderedDict[Tuple[str, int], Tuple[float, List[Dict]]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, int], Future] = {}
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="news-refresh")
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return re.sub(r"\s+", " ", query or "").strip().lower()
+
+    def fetch(self, query: str, limit: int = 3) -> List[Dict]:
+        """
+        One uncached request. Raises NewsError on transport, HTTP or API errors.
+        """
+        params = {
+            "q": query,
+            "sortBy": "publishedAt",
+            "language": "en",
+            "apiKey": self.api_key,
+            "pageSize": limit,
+        }
+
+        import requests
+
+        started = time.perf_counter()
+        try:
+            res = self.session.get(self.base_url, params=params, timeout=self.timeout)
+            data = res.json()
+        except (requests.RequestException, ValueError) as e:
+            raise NewsError(f"News request failed: {e}") from e
+        finally:
+            metrics.observe("news_fetch_seconds", time.perf_counter() - started)
+
+        if res.status_code != 200 or data.get("status") == "error":
+            raise NewsError(f"News API error {res.status_code}: {data.get('message', res.reason)}")
 
         articles = data.get("articles", [])[:limit]
         return [
             {
                 "title": a.get("title"),
                 "url": a.get("url"),
-                "desc": a.get("description", ""),
+                "desc": a.get("description") or "",
                 "source": (a.get("source") or {}).get("name", ""),
             }
             for a in articles
         ]
-    except Exception:
+
+    def _single_flight(self, key: Tuple[str, int], query: str) -> Tuple[Future, bool]:
+        """
+        Returns (future, owner): the in-flight fetch for `key`, creating it if needed.
+        The owner is the caller that must run the fetch.
+        """
+        with self._lock:
+            fut = self._inflight.get(key)
+            if fut is not None:
+                metrics.incr("news_coalesced")
+                return fut, False
+            fut = self._inflight[key] = Future()
+            return fut, True
+
+    def _run(self, key: Tuple[str, int], query: str, fut: Future) -> None:
+        try:
+            articles = self.fetch(query, key[1])
+        except Exception as e:
+            metrics.incr("news_errors")
+            fut.set_exception(e)
+        else:
+            with self._lock:
+                self._cache[key] = (time.monotonic(), articles)
+                self._cache.move_to_end(key)
+                while len(self._cache) > NEWS_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+            fut.set_result(articles)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _refresh(self, key: Tuple[str, int], query: str) -> None:
+        fut, owner = self._single_flight(key, query)
+        if owner:
+            self._refresher.submit(self._run, key, query, fut)
+            # Background failures keep the stale entry; just log them
+            fut.add_done_callback(
+                lambda f: f.exception() and logger.warning("News refresh failed: %s", f.exception())
+            )
+
+    def get(self, query: str, limit: int = 3) -> List[Dict]:
+        """
+        Cached lookup. Raises NewsError only if nothing (not even stale data) is available.
+        """
+        key = (self.normalize(query), limit)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+
+        if entry is not None:
+            age = now - entry[0]
+            if age < self.ttl:
+                metrics.incr("news_cache_hits")
+                return entry[1]
+            if age < self.stale_ttl:
+                metrics.incr("news_stale_hits")
+                self._refresh(key, query)
+                return entry[1]
+
+        metrics.incr("news_cache_misses")
+        fut, owner = self._single_flight(key, query)
+        if owner:
+            self._run(key, query, fut)
+        try:
+            return fut.result(timeout=self.timeout * 2)
+        except Exception:
+            if entry is not None:
+                # Expired, but better than nothing while the API is down
+                return entry[1]
+            raise
+
+
+_client: Optional[NewsClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> NewsClient:
+    """
+    The shared news client, built from settings on first use.
+    """
+    global _client
+
+    with _client_lock:
+        if _client is None:
+            _client = NewsClient(
+                settings.news_url,
+                settings.news_api_key,
+                ttl=settings.news_ttl,
+                stale_ttl=settings.news_stale_ttl,
+            )
+        return _client
+
+
+@tracing.traced("news.lookup")
+def get_recent_news(query: str, limit: int = 3) -> List[Dict]:
+    """
+    Fetch recent news articles related to the query using NewsAPI.
+    Requires NEWS_API_KEY in environment.
+
+    Returns: list of dicts with keys: title, url, desc, source
+    News is optional context, so failures are logged and yield [].
+    """
+    if not settings.news_api_key:
+        return []
+
+    try:
+        return get_client().get(query, limit)
+    except Exception as e:
+        logger.warning("News lookup for %r failed: %s", query, e)
         return []
@@ -1,6 +1,15 @@
-from typing import Dict
-from src.llm_providers import chat
-import json
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+from src.llm_providers import chat, achat, chat_stream, achat_stream, size_class, supports_param
+from src.config import settings
+from src.utils import metrics
+from src.utils.cost import count_tokens, estimate_cost
+from src.utils.prompt import build_messages
+from src.utils.text import parse_json
+import asyncio
+import logging
+import math
+
+logger = logging.getLogger(__name__)
 
 WRITER_SYS = """
 You are a skilled content writer.
@@ -10,28 +19,227 @@ Follow these rules:
 - Include the keywords naturally.
 - Incorporate news references if use_news is true.
 - End with optimized Call-to-Action.
+- If the plan has a diversity_hint, follow it.
 Return the plain text post without any comments.
 """
 
-def generate_post(plan: Dict) -> Dict:
+# Appended to WRITER_SYS when several variants come back from one call
+VARIANTS_SYS = """
+Write {n} distinct variants of the post, each with a different hook and angle.
+Return only a JSON array of exactly {n} strings, one post per string, with no other text.
+"""
+
+VARIANT_STRATEGIES = ("n", "json", "parallel")
+
+# Expected post size in tokens by plan length (every length the UIs offer),
+# for the cost/latency estimate
+POST_TOKENS = {"very short": 80, "short": 150, "medium": 300, "long": 500, "very long": 800}
+# Used until enough real calls have been timed
+FIRST_TOKEN_SECONDS = 0.8
+TOKENS_PER_SECOND = 60.0
+# Array brackets, quotes and separators around each post in json mode
+JSON_TOKENS_PER_POST = 8
+
+
+def _build_prompt(plan: Dict, news: Optional[List[Dict]] = None) -> List[Dict[str, str]]:
+    # Compact plan + news trimmed to the input-token budget
+    messages, _ = build_messages(WRITER_SYS, plan, news)
+    return messages
+
+
+def _build_variants_prompt(plan: Dict, n: int, news: Optional[List[Dict]] = None) -> List[Dict[str, str]]:
+    messages, _ = build_messages(WRITER_SYS + VARIANTS_SYS.format(n=n), plan, news,
+                                 max_tokens=settings.max_tokens * n)
+    return messages
+
+
+def _parse_post(raw: str) -> Dict:
+    # Ensure output is always {"post": "..."}; posts are usually plain text
+    if raw.lstrip("`json \n").startswith("{"):
+        data = parse_json(raw, dict, source="writer")
+        if data and isinstance(data.get("post"), str):
+            return data
+    return {"post": raw}
+
+
+def generate_post(plan: Dict, news: Optional[List[Dict]] = None) -> Dict:
     """
-    Generate LinkedIn post text from a structured plan.
+    Generate LinkedIn post text from a structured plan,
+    optionally grounded in news articles from tools.get_recent_news().
     Always returns: {"post": "..."}
     """
-    prompt = [
-        {"role": "system", "content": WRITER_SYS},
-        {"role": "user", "content": json.dumps(plan)},
-    ]
+    r = chat(_build_prompt(plan, news))
+    return _parse_post(r.get("content", "").strip())
 
-    r = chat(prompt)
-    raw = r.get("content", "").strip()
 
-    # Ensure output is always {"post": "..."}
-    try:
-        data = json.loads(raw)
-        if isinstance(data, dict) and "post" in data:
-            return data
+async def agenerate_post(plan: Dict, variant: int = 0, news: Optional[List[Dict]] = None,
+                         use_cache: bool = True) -> Dict:
+    """
+    Async variant of generate_post().
+    `variant` keeps sibling variants apart in the response cache;
+    use_cache=False asks for a fresh sample (e.g. to regenerate).
+    """
+    r = await achat(_build_prompt(plan, news), cache_slot=variant, use_cache=use_cache)
+    return _parse_post(r.get("content", "").strip())
+
+
+def stream_post(plan: Dict, news: Optional[List[Dict]] = None) -> Iterator[str]:
+    """
+    Streaming variant of generate_post(): yields text deltas as they arrive.
+    Join the deltas and pass them through clean_text() for the final post.
+    """
+    yield from chat_stream(_build_prompt(plan, news))
+
+
+async def astream_post(plan: Dict, variant: int = 0, news: Optional[List[Dict]] = None,
+                       use_cache: bool = True) -> AsyncIterator[str]:
+    """
+    Async variant of stream_post(); `variant` and `use_cache` as in agenerate_post().
+    """
+    async for delta in achat_stream(_build_prompt(plan, news), cache_slot=variant, use_cache=use_cache):
+        yield delta
+
+
+def parse_variants(raw: str) -> List[str]:
+    """
+    Posts from a JSON-array reply: tolerates code fences, surrounding prose,
+    {"posts": [...]} wrappers, [{"post": ...}] items and an array cut off by
+    max_tokens (complete items are kept).
+    """
+    data = parse_json(raw, source="writer", keep_partial=False)
+    if isinstance(data, dict):
+        data = data.get("posts") or data.get("variants")
+    if not isinstance(data, list):
+        return []
+    items = [item.get("post") or item.get("text") if isinstance(item, dict) else item for item in data]
+    return [item.strip() for item in items if isinstance(item, str) and item.strip()]
+
+
+def _post_tokens(length: Any) -> int:
+    # Unknown lengths go by their last word ("extra long" -> long), else medium
+    words = str(length or "").lower().split()
+    key = " ".join(words)
+    if key not in POST_TOKENS and words:
+        key = words[-1]
+    return POST_TOKENS.get(key, POST_TOKENS["medium"])
+
+
+def _call_seconds(model: str, post_tokens: int) -> float:
+    measured = metrics.percentile("llm_latency_seconds", 0.5, min_count=5,
+                                  model=model, size=size_class(settings.max_tokens))
+    return measured or FIRST_TOKEN_SECONDS + post_tokens / TOKENS_PER_SECOND
+
+
+def estimate(plan: Dict, n: int, news: Optional[List[Dict]] = None,
+             concurrency: int | None = None) -> Dict[str, Dict[str, float]]:
+    """
+    Expected calls, tokens, cost and latency of each way to get n variants.
+    """
+    model = settings.model_name
+    # Sized without recording prompt metrics: no request is sent for it
+    _, report = build_messages(WRITER_SYS, plan, news, record=False)
+    prompt = report["tokens"]
+    post = min(_post_tokens(plan.get("length")), settings.max_tokens)
+    single = _call_seconds(model, post)
+    decode = min(single, post / TOKENS_PER_SECOND)
+    waves = math.ceil(n / max(1, concurrency or settings.concurrency))
+
+    def option(calls: int, input_tokens: int, output_tokens: int, seconds: float) -> Dict[str, float]:
+        usage = {"prompt_tokens": input_tokens, "completion_tokens": output_tokens}
+        return {
+            "calls": calls,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cost_usd": estimate_cost(model, usage)["cost_usd"],
+            "seconds": round(seconds, 3),
+        }
+
+    options = {
+        "parallel": option(n, n * prompt, n * post, waves * single),
+        # One long completion: the posts are decoded one after another
+        "json": option(1, prompt + count_tokens(VARIANTS_SYS), n * (post + JSON_TOKENS_PER_POST),
+                       single + (n - 1) * decode),
+    }
+    if supports_param("n", model):
+        options["n"] = option(1, prompt, n * post, single)
+    return options
+
+
+def choose_strategy(plan: Dict, n: int, news: Optional[List[Dict]] = None,
+                    concurrency: int | None = None) -> str:
+    """
+    WRITER_VARIANTS if it names a strategy; otherwise the cheapest option at
+    most WRITER_MAX_SLOWDOWN (a fraction, default 10%) slower than the fastest
+    (the fastest itself under LOW_LATENCY).
+    """
+    if n <= 1:
+        return "parallel"
+    mode = (settings.writer_variants or "auto").lower()
+    if mode in VARIANT_STRATEGIES:
+        return mode
+
+    options = estimate(plan, n, news, concurrency)
+    fastest = min(o["seconds"] for o in options.values())
+    slack = 0.0 if settings.low_latency else settings.writer_max_slowdown
+    allowed = {name: o for name, o in options.items() if o["seconds"] <= fastest * (1 + slack)}
+    return min(allowed, key=lambda name: (allowed[name]["cost_usd"], allowed[name]["seconds"],
+                                          allowed[name]["input_tokens"]))
+
+
+async def _generate_batched(plan: Dict, n: int, strategy: str, news: Optional[List[Dict]],
+                            use_cache: bool = True) -> List[Dict]:
+    if strategy == "n":
+        r = await achat(_build_prompt(plan, news), n=n, use_cache=use_cache)
+        choices = r.get("choices") or [r.get("content", "")]
+        return [_parse_post(c.strip()) for c in choices if c and c.strip()][:n]
+
+    r = await achat(_build_variants_prompt(plan, n, news), max_tokens=settings.max_tokens * n,
+                    use_cache=use_cache)
+    posts = parse_variants(r.get("content", ""))
+    return [{"post": p} for p in posts[:n]]
+
+
+async def generate_posts(
+    plan: Dict,
+    n: int = 3,
+    concurrency: int | None = None,
+    news: Optional[List[Dict]] = None,
+    strategy: str | None = None,
+    use_cache: bool = True,
+) -> List[Dict]:
+    """
+    Generate n post variants from the same plan.
+    strategy (default: choose_strategy()) is one of
+    - "n": one request for n choices (providers that support `n`)
+    - "json": one request for a JSON array of n posts
+    - "parallel": n concurrent requests, at most `concurrency` in flight
+      (defaults to settings.concurrency)
+    Variants a batched call didn't deliver (all of them, if it failed) are
+    topped up with parallel requests.
+    use_cache=False skips the response cache, for fresh variants of the same plan.
+    Results keep request order: [{"post": "..."}, ...]
+    """
+    strategy = strategy or choose_strategy(plan, n, news, concurrency)
+    metrics.incr("writer_variant_requests", strategy=strategy)
+
+    results: List[Dict] = []
+    if strategy != "parallel" and n > 1:
+        try:
+            results = await _generate_batched(plan, n, strategy, news, use_cache)
+        except Exception as e:
+            # One failed batched call shouldn't lose all n variants: request them one by one
+            logger.warning("Batched %r variant request failed, generating in parallel: %s", strategy, e)
+            metrics.incr("writer_variant_fallbacks", strategy=strategy)
+            results = []
         else:
-            return {"post": raw}
-    except Exception:
-        return {"post": raw}
+            if len(results) < n:
+                metrics.incr("writer_variant_topups", n - len(results), strategy=strategy)
+
+    limit = asyncio.Semaphore(max(1, concurrency or settings.concurrency))
+
+    async def one(i: int) -> Dict:
+        async with limit:
+            return await agenerate_post(plan, variant=i, news=news, use_cache=use_cache)
+
+    results += await asyncio.gather(*(one(i) for i in range(len(results), n)))
+    return results
@@ -0,0 +1,455 @@
+# src/api.py
+"""
+Headless asyncio HTTP API for the agents and the full pipeline (no Streamlit).
+
+    python -m src.api --port 8000
+
+POST /plan      {"topic", "tone", "audience", "length", "cta"?, "use_planner"?}
+POST /generate  {"plan", "n"?, "news"?, "stream"?}
+POST /moderate  {"posts": [...]}
+POST /hashtags  {"posts": [...], "local"?, "keywords"?}
+POST /pipeline  {"topic", "tone", "audience", "length", "overrides"?, "use_planner"?, "n"?, "stream"?}
+GET  /healthz, /readyz, /metrics (see src.health)
+
+"n" (default 3) is the number of post variants, at most API_MAX_VARIANTS.
+
+Responses are JSON. With "stream": true they are NDJSON over chunked encoding:
+{"event": "delta", "variant": i, "text": <new text>} lines to append to variant
+i, {"event": "replace", "variant": i, "text": <whole text>} when /pipeline
+swaps a variant for a regenerated one, then one {"event": "result", ...}
+(or {"event": "error", ...}) line.
+
+Requests with the same body (apart from "stream") in flight at the same time
+are coalesced: the first one runs, later ones attach to it and receive the
+same events and result, so a burst of the same topic costs one set of LLM
+calls. A streaming request that joins a JSON run gets only the result line.
+"""
+
+import argparse
+import asyncio
+import http.client
+import json
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from src import health
+from src.agents import planner, writer, guardrails, hashtags
+from src.agents.graph import arun_pipeline
+from src.config import settings
+from src.utils import metrics
+from src.utils.cache import make_key
+from src.utils.moderation import cached_verdict
+from src.utils.text import clean_text
+
+MAX_BODY_BYTES = 1024 * 1024
+READ_TIMEOUT = 30.0
+
+Emit = Callable[[Dict[str, Any]], None]
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _require(body: Dict, *fields: str) -> None:
+    missing = [f for f in fields if not body.get(f)]
+    if missing:
+        raise HTTPError(400, f"missing field(s): {', '.join(missing)}")
+
+
+def _posts(body: Dict) -> List[str]:
+    posts = body.get("posts")
+    if not isinstance(posts, list) or not all(isinstance(p, str) for p in posts):
+        raise HTTPError(400, '"posts" must be a list of strings')
+    return posts
+
+
+def _variants(body: Dict) -> int:
+    n = body.get("n", 3)
+    limit = settings.api_max_variants
+    # bool is an int subclass, but {"n": true} is not a count
+    if not isinstance(n, int) or isinstance(n, bool) or not 1 <= n <= limit:
+        raise HTTPError(400, f'"n" must be an integer from 1 to {limit}')
+    return n
+
+
+def _object(body: Dict, field: str) -> Dict:
+    value = body.get(field)
+    if value is None:
+        return {}
+    if not isinstance(value, dict):
+        raise HTTPError(400, f'"{field}" must be an object')
+    return value
+
+
+# --- handlers: (body, emit) -> JSON-serializable result ---
+
+async def plan(body: Dict, emit: Emit) -> Dict:
+    _require(body, "topic")
+    args = (
+        body["topic"], body.get("tone", "Professional"),
+        body.get("audience", "Professionals"), body.get("length", "Medium"),
+    )
+    if body.get("use_planner", True):
+        return {"plan": await asyncio.to_thread(planner.plan, *args, body.get("cta"))}
+    return {"plan": planner.default_plan(*args)}
+
+
+async def generate(body: Dict, emit: Emit) -> Dict:
+    _require(body, "plan")
+    plan_data, news = _object(body, "plan"), body.get("news") or []
+    n = _variants(body)
+
+    if not body.get("stream"):
+        results = await writer.generate_posts(plan_data, n, news=news)
+        return {"posts": [clean_text(r.get("post", "")) for r in results]}
+
+    async def one(i: int) -> str:
+        parts = []
+        async for delta in writer.astream_post(plan_data, variant=i, news=news):
+            parts.append(delta)
+            emit({"event": "delta", "variant": i, "text": delta})
+        return clean_text("".join(parts))
+
+    return {"posts": list(await asyncio.gather(*(one(i) for i in range(n))))}
+
+
+async def moderate(body: Dict, emit: Emit) -> Dict:
+    posts = _posts(body)
+    final = await asyncio.to_thread(guardrails.guard_all, posts)
+    return {"posts": final, "verdicts": [cached_verdict(p) for p in posts]}
+
+
+async def tags(body: Dict, emit: Emit) -> Dict:
+    posts = _posts(body)
+    if body.get("local"):
+        keywords = body.get("keywords")
+        return {"hashtags": [hashtags.extract_hashtags(p, keywords) for p in posts]}
+    return {"hashtags": await asyncio.to_thread(hashtags.generate_hashtags_batch, posts)}
+
+
+def _delta_events(emit: Emit) -> Callable[[int, str], None]:
+    """
+    Turns the pipeline's on_delta(i, text_so_far) into events carrying only
+    the new text, or a "replace" event when the text doesn't extend what was sent.
+    """
+    sent: Dict[int, str] = {}
+
+    def on_delta(i: int, text: str) -> None:
+        previous = sent.get(i, "")
+        sent[i] = text
+        if text.startswith(previous):
+            if len(text) > len(previous):
+                emit({"event": "delta", "variant": i, "text": text[len(previous):]})
+        else:
+            emit({"event": "replace", "variant": i, "text": text})
+
+    return on_delta
+
+
+async def pipeline(body: Dict, emit: Emit) -> Dict:
+    _require(body, "topic")
+    on_delta = _delta_events(emit) if body.get("stream") else None
+    n = _variants(body)
+    overrides = _object(body, "overrides")
+
+    return await arun_pipeline(
+        body["topic"],
+        body.get("tone", "Professional"),
+        body.get("audience", "Professionals"),
+        body.get("length", "Medium"),
+        overrides=overrides,
+        use_planner=bool(body.get("use_planner", True)),
+        n=n,
+        on_delta=on_delta,
+    )
+
+
+ROUTES: Dict[str, Callable[[Dict, Emit], Awaitable[Dict]]] = {
+    "/plan": plan,
+    "/generate": generate,
+    "/moderate": moderate,
+    "/hashtags": tags,
+    "/pipeline": pipeline,
+}
+
+
+class Flight:
+    """
+    One running request that any number of identical requests can follow:
+    events are kept so late joiners replay them before the live ones.
+    """
+
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = []
+        self.done = False
+        self._changed = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+
+    def emit(self, event: Dict[str, Any]) -> None:
+        # May be called from worker threads
+        self._loop.call_soon_threadsafe(self._push, event)
+
+    def _push(self, event: Dict[str, Any]) -> None:
+        self.events.append(event)
+        self._changed.set()
+
+    def finish(self, event: Dict[str, Any]) -> None:
+        self._push(event)
+        self.done = True
+
+    async def follow(self) -> AsyncIterator[Dict[str, Any]]:
+        seen = 0
+        while True:
+            while seen < len(self.events):
+                seen += 1
+                yield self.events[seen - 1]
+            if self.done:
+                return
+            self._changed.clear()
+            if seen == len(self.events) and not self.done:
+                await self._changed.wait()
+
+
+class API:
+    def __init__(self):
+        self._flights: Dict[str, Flight] = {}
+
+    def _start(self, path: str, body: Dict) -> Flight:
+        """
+        The in-flight run for this request, started if there is none.
+        """
+        # JSON and streaming callers of the same request share one run
+        key = make_key(path=path, body={k: v for k, v in body.items() if k != "stream"})
+        flight = self._flights.get(key)
+        if flight is not None:
+            metrics.incr("api_coalesced", path=path)
+            return flight
+
+        flight = self._flights[key] = Flight()
+
+        async def run() -> None:
+            try:
+                result = await ROUTES[path](body, flight.emit)
+                await asyncio.sleep(0)  # let thread-emitted deltas land first
+                flight.finish({"event": "result", **result})
+            except HTTPError as e:
+                flight.finish({"event": "error", "status": e.status, "error": str(e)})
+            except Exception as e:
+                metrics.incr("api_errors", path=path)
+                flight.finish({"event": "error", "status": 500, "error": str(e)})
+            finally:
+                self._flights.pop(key, None)
+
+        # Not tied to the caller: a disconnecting client doesn't cancel the others
+        asyncio.ensure_future(run())
+        return flight
+
+    async def handle(self, method: str, path: str, body: Dict) -> Tuple[int, Any]:
+        """
+        Returns (status, payload) where payload is a dict, bytes, or an async
+        iterator of NDJSON events.
+        """
+        if method == "GET":
+            status, _, data = health.handle(path)
+            return status, data
+        if path not in ROUTES:
+            raise HTTPError(404, f"no route {path}")
+        if method != "POST":
+            raise HTTPError(405, "use POST")
+
+        metrics.incr("api_requests", path=path)
+        flight = self._start(path, body)
+        if body.get("stream"):
+            return 200, flight.follow()
+
+        async for event in flight.follow():
+            if event["event"] == "result":
+                return 200, {k: v for k, v in event.items() if k != "event"}
+            if event["event"] == "error":
+                return event["status"], {"error": event["error"]}
+        return 500, {"error": "request ended without a result"}
+
+
+# --- HTTP/1.1 over asyncio streams ---
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Tuple[str, str, Dict]:
+    line = await asyncio.wait_for(reader.readline(), READ_TIMEOUT)
+    try:
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "malformed request line")
+
+    headers: Dict[str, str] = {}
+    while True:
+        line = await asyncio.wait_for(reader.readline(), READ_TIMEOUT)
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, "request body too large")
+    body: Dict = {}
+    if length:
+        raw = await asyncio.wait_for(reader.readexactly(length), READ_TIMEOUT)
+        try:
+            body = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise HTTPError(400, f"invalid JSON: {e}")
+        if not isinstance(body, dict):
+            raise HTTPError(400, "body must be a JSON object")
+    return method.upper(), urlparse(target).path.rstrip("/") or "/", body
+
+
+def _head(status: int, headers: Dict[str, str]) -> bytes:
+    lines = [f"HTTP/1.1 {status} {_REASONS.get(status, 'Unknown')}"]
+    lines += [f"{k}: {v}" for k, v in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def _respond(writer: asyncio.StreamWriter, status: int, payload: Any) -> None:
+    if isinstance(payload, (bytes, dict)):
+        if isinstance(payload, dict):
+            data, content_type = json.dumps(payload, default=str).encode("utf-8"), "application/json"
+        else:
+            data = payload
+            content_type = "text/plain; charset=utf-8" if payload[:1] != b"{" else "application/json"
+        writer.write(_head(status, {
+            "Content-Type": content_type, "Content-Length": str(len(data)), "Connection": "close",
+        }) + data)
+        await writer.drain()
+        return
+
+    # Streaming: one NDJSON line per chunk
+    writer.write(_head(status, {
+        "Content-Type": "application/x-ndjson", "Transfer-Encoding": "chunked",
+        "Cache-Control": "no-store", "Connection": "close",
+    }))
+    async for event in payload:
+        line = (json.dumps(event, default=str) + "\n").encode("utf-8")
+        writer.write(f"{len(line):x}\r\n".encode("latin-1") + line + b"\r\n")
+        await writer.drain()
+    writer.write(b"0\r\n\r\n")
+    await writer.drain()
+
+
+def make_handler(api: API):
+    async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            try:
+                method, path, body = await _read_request(reader)
+                status, payload = await api.handle(method, path, body)
+            except HTTPError as e:
+                status, payload = e.status, {"error": str(e)}
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+                status, payload = 400, {"error": f"bad request: {e}"}
+            await _respond(writer, status, payload)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    return handle_connection
+
+
+async def serve(host: str = "127.0.0.1", port: int = 8000) -> asyncio.AbstractServer:
+    return await asyncio.start_server(make_handler(API()), host, port)
+
+
+# --- local test client ---
+
+class TestClient:
+    """
+    Runs the API on an ephemeral port in a background thread and talks to it
+    over real HTTP:
+
+        with TestClient() as client:
+            status, data = client.post("/plan", {"topic": "AI"})
+            for event in client.stream("/pipeline", {"topic": "AI"}):
+                ...
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "TestClient":
+        ready = threading.Event()
+
+        def run() -> None:
+            self._loop = asyncio.new_event_loop()
+            self._server = self._loop.run_until_complete(serve(self.host, self.port))
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="api-test-server", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def close(self) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+
+    def __enter__(self) -> "TestClient":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _request(self, method: str, path: str, body: Optional[Dict] = None) -> http.client.HTTPResponse:
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=300)
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        conn.request(method, path, body=data, headers={"Content-Type": "application/json"})
+        return conn.getresponse()
+
+    def get(self, path: str) -> Tuple[int, bytes]:
+        resp = self._request("GET", path)
+        return resp.status, resp.read()
+
+    def post(self, path: str, body: Dict) -> Tuple[int, Dict]:
+        resp = self._request("POST", path, body)
+        return resp.status, json.loads(resp.read() or b"{}")
+
+    def stream(self, path: str, body: Dict) -> Iterator[Dict]:
+        resp = self._request("POST", path, {**body, "stream": True})
+        for line in resp:
+            if line.strip():
+                yield json.loads(line)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Serve the post-generation API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    async def run() -> None:
+        server = await serve(args.host, args.port)
+        print(f"API on http://{args.host}:{args.port}")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# src/batch.py
+"""
+Headless bulk generation over JSONL.
+
+    python -m src.batch in.jsonl out.jsonl [--concurrency 4] [--variants 3]
+
+Each input line is a JSON object with a "topic" and optionally "id", "tone",
+"audience", "length", "outline", "keywords", "cta", "use_news" and "variants".
+Each output line holds the pipeline result for one input, written as soon
+as it finishes. Output lines double as the checkpoint: re-running with the
+same output file skips every id already in it, so an interrupted run
+resumes without repeating paid calls. Failed inputs are reported on stderr
+and not checkpointed, so the next run retries them.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+from typing import Dict, Iterator, Optional, Set, Tuple
+
+from src.agents.graph import arun_pipeline
+from src.config import settings
+
+PLAN_FIELDS = ("outline", "keywords", "cta", "use_news")
+
+
+def read_requests(path: str) -> Iterator[Tuple[str, Dict]]:
+    """
+    Streams (id, request) pairs from a JSONL file, one line at a time.
+    """
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"[batch] skipping line {lineno}: {e}", file=sys.stderr)
+                continue
+            yield str(item.get("id") or item.get("request_id") or f"line-{lineno}"), item
+
+
+def completed_ids(path: str) -> Set[str]:
+    """
+    Ids already present in the output file. A torn last line (crash mid-write) is ignored.
+    """
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                done.add(str(json.loads(line)["id"]))
+            except (json.JSONDecodeError, KeyError, TypeError):
+                continue
+    return done
+
+
+async def _generate(item: Dict, variants: int, use_planner: bool) -> Dict:
+    overrides = {k: item[k] for k in PLAN_FIELDS if k in item}
+    return await arun_pipeline(
+        item["topic"],
+        item.get("tone", "Professional"),
+        item.get("audience", "Professionals"),
+        item.get("length", "Medium"),
+        overrides=overrides,
+        use_planner=use_planner,
+        n=int(item.get("variants", variants)),
+    )
+
+
+async def run_batch(
+    input_path: str,
+    output_path: str,
+    *,
+    concurrency: int,
+    variants: int = 3,
+    use_planner: bool = True,
+    max_failures: Optional[int] = None,
+) -> Dict[str, int]:
+    """
+    Runs the pipeline for every pending input with at most `concurrency` in flight.
+    Stops early after `max_failures` consecutive failures (e.g. quota exhausted).
+    Returns counts: {"done", "skipped", "failed"}.
+    """
+    done = completed_ids(output_path)
+    counts = {"done": 0, "skipped": 0, "failed": 0}
+    consecutive_failures = 0
+    stop = asyncio.Event()
+
+    # Make sure appended records start on a fresh line after a torn write
+    if os.path.exists(output_path) and os.path.getsize(output_path):
+        with open(output_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            torn = f.read(1) != b"\n"
+        if torn:
+            with open(output_path, "a", encoding="utf-8") as f:
+                f.write("\n")
+
+    slots = asyncio.Semaphore(max(1, concurrency))
+    in_flight: Set[asyncio.Task] = set()
+
+    with open(output_path, "a", encoding="utf-8") as out:
+
+        async def one(request_id: str, item: Dict) -> None:
+            nonlocal consecutive_failures
+            try:
+                result = await _generate(item, variants, use_planner)
+            except Exception as e:
+                counts["failed"] += 1
+                consecutive_failures += 1
+                print(f"[batch] {request_id} failed: {e}", file=sys.stderr)
+                if max_failures and consecutive_failures >= max_failures:
+                    stop.set()
+                return
+            finally:
+                slots.release()
+
+            consecutive_failures = 0
+            record = {"id": request_id, "topic": item["topic"], **result}
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            os.fsync(out.fileno())
+            done.add(request_id)
+            counts["done"] += 1
+
+        for request_id, item in read_requests(input_path):
+            if request_id in done:
+                counts["skipped"] += 1
+                continue
+            if not item.get("topic"):
+                print(f"[batch] {request_id} has no topic, skipping", file=sys.stderr)
+                counts["failed"] += 1
+                continue
+
+            await slots.acquire()
+            if stop.is_set():
+                slots.release()
+                break
+
+            # Mark as taken so duplicate ids later in the input aren't run twice
+            done.add(request_id)
+            task = asyncio.create_task(one(request_id, item))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+
+        if in_flight:
+            await asyncio.gather(*in_flight)
+
+    if stop.is_set():
+        print(f"[batch] stopped after {max_failures} consecutive failures; re-run to resume", file=sys.stderr)
+
+    return counts
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generate LinkedIn posts for every topic in a JSONL file.")
+    parser.add_argument("input", help="input JSONL, one request per line")
+    parser.add_argument("output", help="output JSONL; also the resume checkpoint")
+    parser.add_argument("--concurrency", type=int, default=settings.concurrency,
+                        help="pipelines in flight at once (default: LLM_CONCURRENCY)")
+    parser.add_argument("--variants", type=int, default=3, help="post variants per topic (default: 3)")
+    parser.add_argument("--no-planner", action="store_true",
+                        help="build plans from the input fields instead of calling the planner LLM")
+    parser.add_argument("--max-failures", type=int, default=10,
+                        help="stop after this many consecutive failures, 0 to never stop (default: 10)")
+    args = parser.parse_args(argv)
+
+    counts = asyncio.run(
+        run_batch(
+            args.input,
+            args.output,
+            concurrency=args.concurrency,
+            variants=args.variants,
+            use_planner=not args.no_planner,
+            max_failures=args.max_failures or None,
+        )
+    )
+    print(json.dumps(counts), file=sys.stderr)
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
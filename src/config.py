@@ -1,29 +1,229 @@
 import os
-from dataclasses import dataclass
-from typing import Optional
-import streamlit as st
+import sys
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+_BOOL_TRUE = ("1", "true", "yes")
+
+_file_secrets: Optional[Dict[str, Any]] = None
+_file_lock = threading.Lock()
+
+
+def _load_files() -> Dict[str, Any]:
+    """
+    Loads .env into the environment (via python-dotenv, if installed) and parses
+    .streamlit/secrets.toml directly, once, so headless entry points see the
+    same configuration as the UI without importing Streamlit.
+    """
+    global _file_secrets
+
+    with _file_lock:
+        if _file_secrets is None:
+            try:
+                from dotenv import load_dotenv
+                load_dotenv()
+            except ImportError:
+                pass
+
+            _file_secrets = {}
+            path = os.path.join(".streamlit", "secrets.toml")
+            if os.path.exists(path):
+                try:
+                    import tomllib
+                    with open(path, "rb") as f:
+                        _file_secrets = tomllib.load(f)
+                except (ImportError, ValueError, OSError):
+                    pass
+        return _file_secrets
+
+
+def _secret(name: str, default: Any = None) -> Any:
+    """
+    Reads a setting from Streamlit secrets (st.secrets when running under
+    Streamlit, otherwise .streamlit/secrets.toml), then the environment and .env.
+    Streamlit is never imported here, so headless entry points stay UI-free.
+    """
+    file_secrets = _load_files()
+
+    st = sys.modules.get("streamlit")
+    if st is not None:
+        try:
+            value = st.secrets.get(name)
+        except Exception:
+            value = None
+    else:
+        value = file_secrets.get(name)
+    if value is not None:
+        return value
+    return os.environ.get(name, default)
+
+
+def _fallback_models() -> List[str]:
+    """
+    LLM_FALLBACK_MODELS if set, otherwise one model per extra provider key present.
+    """
+    configured = _secret("LLM_FALLBACK_MODELS")
+    if configured is not None:
+        return [m.strip() for m in str(configured).split(",") if m.strip()]
+
+    models = []
+    if _secret("OPENAI_API_KEY"):
+        models.append("gpt-4o-mini")
+    if _secret("ANTHROPIC_API_KEY"):
+        models.append("claude-3-haiku-20240307")
+    if _secret("HUGGINGFACE_API_KEY"):
+        models.append("huggingface/mistralai/Mixtral-8x7B-Instruct-v0.1")
+    return models
+
+
+# Field helpers: each value is read when Settings() is built, not at import time
+
+def _str(name: str, default: Optional[str] = None) -> Any:
+    return field(default_factory=lambda: _secret(name, default))
+
+
+def _int(name: str, default: int) -> Any:
+    return field(default_factory=lambda: int(_secret(name, default)))
+
+
+def _float(name: str, default: Optional[float] = None) -> Any:
+    def read() -> Optional[float]:
+        value = _secret(name, default)
+        return float(value) if value not in (None, "") else None
+    return field(default_factory=read)
+
+
+def _bool(name: str, default: bool) -> Any:
+    return field(default_factory=lambda: str(_secret(name, default)).lower() in _BOOL_TRUE)
 
 
 @dataclass
 class Settings:
     # Default to Gemini (student-friendly, free daily quota)
-    model_name: str = st.secrets.get("MODEL_NAME", "gemini-1.5-flash")
-    provider: str = st.secrets.get("LLM_PROVIDER", "gemini")
+    model_name: str = _str("MODEL_NAME", "gemini-1.5-flash")
+    provider: str = _str("LLM_PROVIDER", "gemini")
+
+    # Alternative endpoints (e.g. a LiteLLM proxy, or benchmarks/mock_server.py):
+    # LLM_API_BASE for chat() calls, GEMINI_API_BASE for the moderation client
+    api_base: Optional[str] = _str("LLM_API_BASE")
+    gemini_api_base: Optional[str] = _str("GEMINI_API_BASE")
 
     # Sampling params
-    temperature: float = float(st.secrets.get("TEMPERATURE", 0.7))
-    max_tokens: int = int(st.secrets.get("MAX_TOKENS", 1000))
+    temperature: float = _float("TEMPERATURE", 0.7)
+    max_tokens: int = _int("MAX_TOKENS", 1000)
+
+    # Input-token budget for built prompts (plan + news context)
+    prompt_token_budget: int = _int("PROMPT_TOKEN_BUDGET", 1500)
+
+    # Variants more similar than this (0-100, rapidfuzz) are regenerated, for at most N rounds
+    diversity_threshold: float = _float("DIVERSITY_THRESHOLD", 85)
+    diversity_max_rounds: int = _int("DIVERSITY_MAX_ROUNDS", 1)
+
+    # Max LLM requests in flight when fanning out post variants
+    concurrency: int = _int("LLM_CONCURRENCY", 3)
+    # Most variants one API request may ask for ("n" in /generate and /pipeline)
+    api_max_variants: int = _int("API_MAX_VARIANTS", 5)
+
+    # How N post variants are requested: auto, n (one call, provider `n`),
+    # json (one call, JSON array of posts) or parallel (one call per variant).
+    # auto takes the cheapest option at most WRITER_MAX_SLOWDOWN (a fraction)
+    # slower than the fastest one, so a small saving never costs a long wait.
+    writer_variants: str = _str("WRITER_VARIANTS", "auto")
+    writer_max_slowdown: float = _float("WRITER_MAX_SLOWDOWN", 0.1)
+
+    # Rate limiting: override per-model requests/tokens per minute, retries on 429/5xx
+    llm_rpm: Optional[float] = _float("LLM_RPM")
+    llm_tpm: Optional[float] = _float("LLM_TPM")
+    llm_max_retries: int = _int("LLM_MAX_RETRIES", 4)
+
+    # Failover/hedging: comma-separated fallback models tried after the primary
+    fallback_models: List[str] = field(default_factory=_fallback_models)
+    hedge_enabled: bool = _bool("LLM_HEDGE", True)
+    hedge_percentile: float = _float("LLM_HEDGE_PERCENTILE", 0.9)
+    hedge_min_samples: int = _int("LLM_HEDGE_MIN_SAMPLES", 20)
+
+    # Planner cache: a plan is reused for a topic at least this similar (0-100,
+    # rapidfuzz) with the same tone/audience/length; PLAN_CACHE_SIZE=0 turns it off
+    plan_cache_size: int = _int("PLAN_CACHE_SIZE", 20000)
+    plan_cache_threshold: float = _float("PLAN_CACHE_THRESHOLD", 90)
+
+    # Trade quality for speed: e.g. build hashtags locally instead of via the LLM
+    low_latency: bool = _bool("LOW_LATENCY", False)
+
+    # Local pre-moderation before the LLM guardrail, plus optional extra term lists
+    moderation_prefilter: bool = _bool("MODERATION_PREFILTER", True)
+    moderation_terms_path: Optional[str] = _str("MODERATION_TERMS_PATH")
+    # Text counts as locally SAFE only with this many distinct professional terms
+    # making up at least this share of its words; anything less goes to the LLM
+    moderation_safe_min_hits: int = _int("MODERATION_SAFE_MIN_HITS", 4)
+    moderation_safe_min_density: float = _float("MODERATION_SAFE_MIN_DENSITY", 0.08)
+
+    # Opt-in response cache in front of chat()
+    cache_enabled: bool = _bool("LLM_CACHE", False)
+    cache_path: str = _str("LLM_CACHE_PATH", ".cache/llm_responses.sqlite")
+    cache_ttl: float = _float("LLM_CACHE_TTL", 3600)
+    cache_max_entries: int = _int("LLM_CACHE_MAX_ENTRIES", 512)
+    cache_max_bytes: int = _int("LLM_CACHE_MAX_BYTES", 50 * 1024 * 1024)
+
+    # Local generation history (SQLite + FTS5)
+    history_enabled: bool = _bool("HISTORY_ENABLED", True)
+    history_path: str = _str("HISTORY_PATH", ".cache/history.sqlite")
+
+    # Observability: spans (TRACING, or an OTel-style JSON-lines TRACE_LOG file)
+    # and a Prometheus /metrics endpoint on METRICS_PORT (0 = off)
+    tracing_enabled: bool = _bool("TRACING", False)
+    trace_log: Optional[str] = _str("TRACE_LOG")
+    metrics_port: int = _int("METRICS_PORT", 0)
+
+    # Liveness/readiness probes (src/health.py) on HEALTH_PORT (0 = off), refreshed in the background
+    health_port: int = _int("HEALTH_PORT", 0)
+    health_check_interval: float = _float("HEALTH_CHECK_INTERVAL", 30)
 
     # API keys
-    gemini_key: Optional[str] = st.secrets.get("GEMINI_API_KEY")      # Google AI Studio
-    hf_key: Optional[str] = st.secrets.get("HUGGINGFACE_API_KEY")     # Hugging Face Inference
+    gemini_key: Optional[str] = _str("GEMINI_API_KEY")      # Google AI Studio
+    hf_key: Optional[str] = _str("HUGGINGFACE_API_KEY")     # Hugging Face Inference
 
     # Optional OpenAI/Anthropic (not default, but supported if you add keys)
-    openai_key: Optional[str] = st.secrets.get("OPENAI_API_KEY")
-    anthropic_key: Optional[str] = st.secrets.get("ANTHROPIC_API_KEY")
+    openai_key: Optional[str] = _str("OPENAI_API_KEY")
+    anthropic_key: Optional[str] = _str("ANTHROPIC_API_KEY")
 
     # Optional NewsAPI tool
-    news_api_key: Optional[str] = st.secrets.get("NEWS_API_KEY")
+    news_api_key: Optional[str] = _str("NEWS_API_KEY")
+    news_url: str = _str("NEWS_API_URL", "https://newsapi.org/v2/everything")
+    # Results are fresh for NEWS_TTL seconds, then served stale (and refreshed) up to NEWS_STALE_TTL
+    news_ttl: float = _float("NEWS_TTL", 600)
+    news_stale_ttl: float = _float("NEWS_STALE_TTL", 3600)
+
+
+class _LazySettings:
+    """
+    Module-level `settings` handle: Settings() is built on first attribute
+    access, so importing src.config (and everything that imports it) reads no
+    secrets, files or environment.
+    """
+
+    def __init__(self):
+        self._settings: Optional[Settings] = None
+        self._lock = threading.Lock()
+
+    def _get(self) -> Settings:
+        if self._settings is None:
+            with self._lock:
+                if self._settings is None:
+                    self._settings = Settings()
+        return self._settings
+
+    def reload(self) -> Settings:
+        """
+        Re-reads every setting, e.g. after changing the environment.
+        """
+        with self._lock:
+            self._settings = Settings()
+        return self._settings
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._get(), name)
 
 
-settings = Settings()
+settings = _LazySettings()
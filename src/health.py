@@ -0,0 +1,294 @@
+# src/health.py
+"""
+Cheap liveness/readiness probes, served without Streamlit.
+
+    HEALTH_PORT=8081 streamlit run main.py  # inside the app process
+    python -m src.api --port 8000           # inside the API process (same paths)
+    python -m src.health --port 8081        # standalone: config + connectivity only
+
+GET /healthz  liveness: the process answers (always 200)
+GET /readyz   readiness: 200 when a provider is reachable, else 503
+GET /metrics  Prometheus text (see src.utils.metrics)
+
+Requests never do any work themselves: they return the snapshot that a
+background thread refreshes every HEALTH_CHECK_INTERVAL seconds from
+provider reachability (a TCP connect, no quota spent), rate-limiter headroom,
+response-cache status and the LLM error rate since the previous check.
+
+Rate-limiter headroom and the error rate are read from this process's own
+limiters and counters, so they only mean something when the probes run
+inside the app or API. The standalone server leaves them out ("scope":
+"standalone" in /readyz) and reports provider reachability and cache status.
+"""
+
+import argparse
+import json
+import socket
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from src.config import settings
+from src.utils import metrics, ratelimit
+
+# Public endpoint per provider, probed when no custom api_base is configured
+PROVIDER_HOSTS = {
+    "gemini": "https://generativelanguage.googleapis.com",
+    "openai": "https://api.openai.com",
+    "anthropic": "https://api.anthropic.com",
+    "huggingface": "https://api-inference.huggingface.co",
+}
+
+CONNECT_TIMEOUT = 2.0
+# Below this share of rate-limit headroom a model counts as saturated
+MIN_HEADROOM = 0.05
+# LLM error share (since the previous check) above which we report "degraded"
+MAX_ERROR_RATE = 0.5
+
+
+def _provider(model: str) -> str:
+    m = model.lower()
+    if m.startswith("huggingface/"):
+        return "huggingface"
+    if m.startswith(("openai/", "gpt-", "o1", "o3")):
+        return "openai"
+    if m.startswith(("anthropic/", "claude")):
+        return "anthropic"
+    return "gemini"
+
+
+def _endpoints() -> Dict[str, str]:
+    """
+    {name: url} for every endpoint the configured models would call.
+    """
+    if settings.api_base:
+        endpoints = {"llm": settings.api_base}
+    else:
+        models = [settings.model_name] + list(settings.fallback_models)
+        endpoints = {_provider(m): PROVIDER_HOSTS[_provider(m)] for m in models}
+    endpoints["moderation"] = settings.gemini_api_base or PROVIDER_HOSTS["gemini"]
+    return endpoints
+
+
+def _reachable(url: str) -> Tuple[bool, float, Optional[str]]:
+    parsed = urlparse(url)
+    port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    started = time.perf_counter()
+    try:
+        with socket.create_connection((parsed.hostname, port), timeout=CONNECT_TIMEOUT):
+            pass
+    except OSError as e:
+        return False, time.perf_counter() - started, str(e)
+    return True, time.perf_counter() - started, None
+
+
+class HealthChecker:
+    def __init__(self, interval: float = 30.0, process_checks: bool = True):
+        # process_checks: also judge this process's limiters and LLM error rate
+        self.interval = interval
+        self.process_checks = process_checks
+        self.started = time.time()
+        self._snapshot: Dict[str, Any] = {"status": "starting", "ready": False, "checks": {}}
+        self._lock = threading.Lock()
+        self._last_counts: Optional[Tuple[float, float]] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    # --- checks ---
+
+    def _check_providers(self) -> Dict[str, Any]:
+        results = {}
+        for name, url in _endpoints().items():
+            ok, seconds, error = _reachable(url)
+            results[name] = {"url": url, "reachable": ok, "connect_ms": round(seconds * 1000, 1)}
+            if error:
+                results[name]["error"] = error
+        return results
+
+    @staticmethod
+    def _check_limiters() -> Dict[str, Any]:
+        stats = ratelimit.limiter_stats()
+        saturated = [
+            model for model, s in stats.items()
+            if min(s["request_headroom"], s["token_headroom"]) < MIN_HEADROOM
+        ]
+        return {"models": stats, "saturated": saturated}
+
+    @staticmethod
+    def _check_cache() -> Dict[str, Any]:
+        if not settings.cache_enabled:
+            return {"enabled": False}
+        try:
+            from src.utils.cache import get_cache
+            return {"enabled": True, "ok": True, **get_cache().stats()}
+        except Exception as e:
+            return {"enabled": True, "ok": False, "error": str(e)}
+
+    def _check_errors(self) -> Dict[str, Any]:
+        calls = metrics.counter_total("llm_calls")
+        errors = metrics.counter_total("llm_errors")
+        previous = self._last_counts or (0.0, 0.0)
+        self._last_counts = (calls, errors)
+
+        window_calls = calls - previous[0]
+        window_errors = errors - previous[1]
+        return {
+            "calls": int(window_calls),
+            "errors": int(window_errors),
+            "error_rate": round(window_errors / window_calls, 4) if window_calls else 0.0,
+        }
+
+    def run_checks(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        checks = {
+            "providers": self._check_providers(),
+            "cache": self._check_cache(),
+        }
+        if self.process_checks:
+            checks["limiters"] = self._check_limiters()
+            checks["errors"] = self._check_errors()
+
+        llm = [v for k, v in checks["providers"].items() if k != "moderation"]
+        ready = any(p["reachable"] for p in llm)
+        degraded = (
+            not all(p["reachable"] for p in checks["providers"].values())
+            or checks["cache"].get("ok") is False
+            or (self.process_checks and (
+                bool(checks["limiters"]["saturated"])
+                or checks["errors"]["error_rate"] > MAX_ERROR_RATE
+            ))
+        )
+
+        snapshot = {
+            "status": "unavailable" if not ready else "degraded" if degraded else "ok",
+            "scope": "process" if self.process_checks else "standalone",
+            "ready": ready,
+            "checked_at": time.time(),
+            "check_ms": round((time.perf_counter() - started) * 1000, 1),
+            "checks": checks,
+        }
+        with self._lock:
+            self._snapshot = snapshot
+        metrics.observe("health_check_seconds", time.perf_counter() - started)
+        return snapshot
+
+    # --- background refresh ---
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_checks()
+            except Exception as e:
+                with self._lock:
+                    self._snapshot = {**self._snapshot, "status": "unavailable", "ready": False, "error": str(e)}
+            self._stop.wait(self.interval)
+
+    def start(self) -> "HealthChecker":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="health-checks", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshot = dict(self._snapshot)
+        snapshot["uptime_seconds"] = round(time.time() - self.started, 1)
+        if "checked_at" in snapshot:
+            snapshot["age_seconds"] = round(time.time() - snapshot["checked_at"], 1)
+        return snapshot
+
+    def liveness(self) -> Dict[str, Any]:
+        return {"status": "ok", "uptime_seconds": round(time.time() - self.started, 1)}
+
+
+_checker: Optional[HealthChecker] = None
+_checker_lock = threading.Lock()
+
+
+def get_checker(process_checks: bool = True) -> HealthChecker:
+    """
+    The process-wide checker, started on first use (process_checks applies
+    to that first call only; see HealthChecker).
+    """
+    global _checker
+
+    with _checker_lock:
+        if _checker is None:
+            _checker = HealthChecker(settings.health_check_interval, process_checks).start()
+        return _checker
+
+
+def handle(path: str) -> Tuple[int, str, bytes]:
+    """
+    (status, content type, body) for a probe path; shared with other servers.
+    """
+    path = path.split("?")[0].rstrip("/")
+    if path == "/metrics":
+        return 200, "text/plain; version=0.0.4; charset=utf-8", metrics.export_prometheus().encode("utf-8")
+    if path in ("/healthz", "/livez", ""):
+        return 200, "application/json", json.dumps(get_checker().liveness()).encode("utf-8")
+    if path == "/readyz":
+        snapshot = get_checker().snapshot()
+        return (200 if snapshot["ready"] else 503), "application/json", json.dumps(snapshot).encode("utf-8")
+    return 404, "application/json", b'{"error": "not found"}'
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_server(port: int, host: str = "0.0.0.0", process_checks: bool = True):
+    """
+    Serves the probes from a daemon thread, once per process (safe to call on
+    every Streamlit rerun). Returns the server.
+    Pass process_checks=False when this process makes no LLM calls itself.
+    """
+    global _server
+
+    with _server_lock:
+        if _server is not None:
+            return _server
+
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                status, content_type, body = handle(self.path)
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        get_checker(process_checks)
+        _server = ThreadingHTTPServer((host, port), Handler)
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="health-http", daemon=True).start()
+        return _server
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Serve liveness/readiness probes.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=settings.health_port or 8081)
+    args = parser.parse_args(argv)
+
+    # Nothing here calls an LLM: limiter and error checks would always be empty
+    server = start_server(args.port, args.host, process_checks=False)
+    print(f"health probes on http://{args.host}:{server.server_address[1]}/readyz (config and connectivity only)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
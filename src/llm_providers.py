@@ -1,46 +1,473 @@
 # src/llm_providers.py
 
-from typing import List, Dict, Any
-from litellm import completion
+import functools
+import time
+from typing import List, Dict, Any, AsyncIterator, Iterator, Tuple
 from src.config import settings
+from src.utils import cost, hedging, metrics, ratelimit, tracing
+from src.utils.cache import get_cache, make_key
 
+
+def _request_kwargs(
+    messages: List[Dict[str, str]],
+    temperature: float | None,
+    max_tokens: int | None,
+    model: str | None,
+    n: int = 1,
+    json_schema: Dict[str, Any] | None = None,
+) -> Dict[str, Any]:
+    """
+    Build the keyword arguments shared by the sync and async completion calls.
+    """
+    provider = settings.provider.lower()
+
+    kwargs = {
+        "model": model or settings.model_name,
+        "messages": messages,
+        "temperature": temperature or settings.temperature,
+        "max_tokens": max_tokens or settings.max_tokens,
+        "api_key": settings.gemini_key if provider == "gemini" else settings.hf_key,
+    }
+    if settings.api_base:
+        kwargs["api_base"] = settings.api_base
+    if n > 1:
+        kwargs["n"] = n
+    if json_schema is not None:
+        response_format = _response_format(kwargs["model"], json_schema)
+        if response_format is not None:
+            kwargs["response_format"] = response_format
+    return kwargs
+
+
+def _response_format(model: str, schema: Dict[str, Any]) -> Dict[str, Any] | None:
+    """
+    The provider's native structured-output mode: the schema where supported,
+    plain JSON mode otherwise, None if the model has neither.
+    """
+    if not supports_param("response_format", model):
+        return None
+    try:
+        litellm = _litellm()
+        name, provider, _, _ = litellm.get_llm_provider(model)
+        with_schema = litellm.supports_response_schema(model=name, custom_llm_provider=provider)
+    except Exception:
+        with_schema = False
+    if with_schema:
+        return {"type": "json_schema", "json_schema": {"name": schema.get("title", "response"), "schema": schema}}
+    return {"type": "json_object"}
+
+
+def _api_key_for(model: str) -> str | None:
+    m = model.lower()
+    if m.startswith("huggingface/"):
+        return settings.hf_key
+    if m.startswith(("openai/", "gpt-", "o1", "o3")):
+        return settings.openai_key
+    if m.startswith(("anthropic/", "claude")):
+        return settings.anthropic_key
+    return settings.gemini_key
+
+
+def _candidates(kwargs: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    The primary request followed by one request per configured fallback model.
+    """
+    fallbacks = [m for m in settings.fallback_models if m != kwargs["model"]]
+    candidates = [kwargs]
+    for m in fallbacks:
+        candidate = {**kwargs, "model": m, "api_key": _api_key_for(m)}
+        if "n" in candidate and not supports_param("n", m):
+            # Answers with a single choice; callers top up the rest
+            del candidate["n"]
+        if "response_format" in candidate:
+            if not supports_param("response_format", m):
+                del candidate["response_format"]
+            elif candidate["response_format"]["type"] == "json_schema":
+                # Not every fallback takes a schema; plain JSON mode is the safe subset
+                candidate["response_format"] = {"type": "json_object"}
+        candidates.append(candidate)
+    return candidates
+
+
+@functools.lru_cache(maxsize=128)
+def supports_param(param: str, model: str | None = None) -> bool:
+    """
+    Whether LiteLLM passes `param` (e.g. "n", "response_format") on to the model.
+    """
+    model = model or settings.model_name
+    try:
+        litellm = _litellm()
+        name, provider, _, _ = litellm.get_llm_provider(model)
+        return param in (litellm.get_supported_openai_params(model=name, custom_llm_provider=provider) or [])
+    except Exception:
+        return False
+
+
+@functools.lru_cache(maxsize=128)
+def context_window(model: str | None = None) -> int | None:
+    """
+    The model's input context in tokens per LiteLLM's model info, or None if unknown.
+    """
+    model = model or settings.model_name
+    try:
+        info = _litellm().get_model_info(model)
+    except Exception:
+        return None
+    window = info.get("max_input_tokens") or info.get("max_tokens")
+    return int(window) if window else None
+
+
+def size_class(max_output_tokens: int) -> str:
+    """
+    Latency bucket for a call by its completion budget: short replies (plans,
+    hashtags, verdicts) and multi-post calls aren't comparable to one post.
+    """
+    if max_output_tokens <= 256:
+        return "short"
+    if max_output_tokens <= 1024:
+        return "medium"
+    return "long"
+
+
+def _size(kwargs: Dict[str, Any]) -> str:
+    return size_class(kwargs["max_tokens"] * kwargs.get("n", 1))
+
+
+def _hedge_delay(kwargs: Dict[str, Any]) -> float | None:
+    """
+    How long to wait on the primary before hedging: a recent latency percentile
+    of comparable calls (same model and size class), or None (no hedge) until
+    enough samples have been seen.
+    """
+    if not settings.hedge_enabled:
+        return None
+    return metrics.percentile(
+        "llm_latency_seconds",
+        settings.hedge_percentile,
+        min_count=settings.hedge_min_samples,
+        model=kwargs["model"],
+        size=_size(kwargs),
+    )
+
+
+def _unpack(resp: Any, model: str) -> Dict[str, Any]:
+    choices = [c.message["content"] or "" for c in resp.choices]
+    usage = getattr(resp, "usage", None) or {}
+
+    return {"content": choices[0], "choices": choices, "usage": usage, "model": model}
+
+
+def _estimate_tokens(kwargs: Dict[str, Any]) -> int:
+    # Rough prompt size (~4 chars per token) plus the completion budget
+    prompt_chars = sum(len(str(m.get("content", ""))) for m in kwargs["messages"])
+    return prompt_chars // 4 + kwargs["max_tokens"] * kwargs.get("n", 1)
+
+
+def _used_tokens(resp: Any) -> int | None:
+    usage = getattr(resp, "usage", None)
+    if usage is None:
+        return None
+    if isinstance(usage, dict):
+        return usage.get("total_tokens")
+    return getattr(usage, "total_tokens", None)
+
+
+def _litellm():
+    # Imported on first call: LiteLLM takes seconds to load, and importing
+    # this module should stay cheap for UI and worker startup.
+    import litellm
+    return litellm
+
+
+def _complete_one(kwargs: Dict[str, Any], retry_throttles: bool = True) -> Any:
+    started = time.perf_counter()
+    resp = ratelimit.call(
+        kwargs["model"],
+        lambda: _litellm().completion(**kwargs),
+        tokens=_estimate_tokens(kwargs),
+        used_tokens=_used_tokens if not kwargs.get("stream") else None,
+        retry_throttles=retry_throttles,
+    )
+    if not kwargs.get("stream"):
+        # Opening a stream says nothing about how long a full reply takes
+        metrics.observe("llm_latency_seconds", time.perf_counter() - started,
+                        model=kwargs["model"], size=_size(kwargs))
+    return resp
+
+
+async def _acomplete_one(kwargs: Dict[str, Any], retry_throttles: bool = True) -> Any:
+    started = time.perf_counter()
+    resp = await ratelimit.acall(
+        kwargs["model"],
+        lambda: _litellm().acompletion(**kwargs),
+        tokens=_estimate_tokens(kwargs),
+        used_tokens=_used_tokens if not kwargs.get("stream") else None,
+        retry_throttles=retry_throttles,
+    )
+    if not kwargs.get("stream"):
+        # Opening a stream says nothing about how long a full reply takes
+        metrics.observe("llm_latency_seconds", time.perf_counter() - started,
+                        model=kwargs["model"], size=_size(kwargs))
+    return resp
+
+
+def _complete(kwargs: Dict[str, Any]) -> Tuple[str, Any]:
+    """
+    Primary call with hedging and failover across the fallback models.
+    Returns (model that answered, response). Streams are never hedged.
+    A throttled model fails over at once; only the last candidate waits
+    out 429s with backoff.
+    """
+    candidates = _candidates(kwargs)
+    last = len(candidates) - 1
+    index, resp = hedging.first_success(
+        [lambda kw=kw, i=i: _complete_one(kw, retry_throttles=i == last) for i, kw in enumerate(candidates)],
+        hedge_after=None if kwargs.get("stream") else _hedge_delay(kwargs),
+    )
+    return candidates[index]["model"], resp
+
+
+async def _acomplete(kwargs: Dict[str, Any]) -> Tuple[str, Any]:
+    """
+    Async variant of _complete().
+    """
+    candidates = _candidates(kwargs)
+    last = len(candidates) - 1
+    index, resp = await hedging.afirst_success(
+        [lambda kw=kw, i=i: _acomplete_one(kw, retry_throttles=i == last) for i, kw in enumerate(candidates)],
+        hedge_after=None if kwargs.get("stream") else _hedge_delay(kwargs),
+    )
+    return candidates[index]["model"], resp
+
+
+def _delta(chunk: Any) -> str:
+    choices = getattr(chunk, "choices", None) or []
+    if not choices:
+        return ""
+    delta = getattr(choices[0], "delta", None)
+    if delta is None:
+        return ""
+    content = delta.get("content") if isinstance(delta, dict) else getattr(delta, "content", None)
+    return content or ""
+
+
+def _cache_key(kwargs: Dict[str, Any], slot: int) -> str:
+    return make_key(
+        model=kwargs["model"],
+        messages=kwargs["messages"],
+        temperature=kwargs["temperature"],
+        max_tokens=kwargs["max_tokens"],
+        slot=slot,
+        **{k: kwargs[k] for k in ("n", "response_format") if k in kwargs},
+    )
+
+
+def _cached(result: Dict[str, Any]) -> Dict[str, Any]:
+    # Entries stored by the streaming calls carry no "choices"
+    return {"choices": [result["content"]], **result, "cached": True}
+
+
+def _storable(result: Dict[str, Any]) -> Dict[str, Any]:
+    usage = result["usage"]
+    if not isinstance(usage, dict):
+        usage = usage.model_dump() if hasattr(usage, "model_dump") else dict(usage)
+    return {"content": result["content"], "choices": result["choices"], "usage": usage, "model": result["model"]}
+
+
+@tracing.traced("llm.chat")
 def chat(
     messages: List[Dict[str, str]],
     *,
     temperature: float | None = None,
     max_tokens: int | None = None,
     model: str | None = None,
+    use_cache: bool = True,
+    cache_slot: int = 0,
+    n: int = 1,
+    json_schema: Dict[str, Any] | None = None,
 ) -> Dict[str, Any]:
     """
     Unified chat interface across Gemini and Hugging Face.
-    Uses LiteLLM under the hood.
+    Uses LiteLLM under the hood, behind the shared per-model rate limiter
+    (retries with backoff on 429s and transient errors).
+    With LLM_FALLBACK_MODELS set, hard failures fail over to the next model and
+    a primary slower than its recent p90 latency is hedged; "model" in the
+    result names the model that answered.
+
+    When the response cache is enabled (LLM_CACHE), identical calls are served
+    from it; pass use_cache=False to force a fresh sample. cache_slot keeps
+    otherwise-identical calls apart (e.g. the N variants of one post).
+
+    With n > 1 the provider is asked for n choices in one request (see
+    supports_param()); result["choices"] holds them. A fallback model without
+    `n` support may return fewer.
+
+    json_schema turns on the provider's JSON/structured-output mode where the
+    model has one; the reply should still be parsed tolerantly (parse_json()).
     """
+    kwargs = _request_kwargs(messages, temperature, max_tokens, model, n, json_schema)
+    metrics.incr("llm_calls", model=kwargs["model"])
 
-    provider = settings.provider.lower()
-    chosen_model = model or settings.model_name
+    cache = get_cache() if use_cache else None
+    if cache is not None:
+        key = _cache_key(kwargs, cache_slot)
+        hit = cache.get(key)
+        if hit is not None:
+            cost.record_usage(hit.get("model") or kwargs["model"], cached=True)
+            return _cached(hit)
 
     try:
-        resp = completion(
-            model=chosen_model,
-            messages=messages,
-            temperature=temperature or settings.temperature,
-            max_tokens=max_tokens or settings.max_tokens,
-            api_key=settings.gemini_key if provider == "gemini" else settings.hf_key,
-        )
+        answered_by, resp = _complete(kwargs)
     except Exception as e:
-        # Fallback: if Gemini fails and HF key exists
-        # if provider == "gemini" and settings.hf_key:
-        #     resp = completion(
-        #         model="huggingface/mistralai/Mixtral-8x7B-Instruct",
-        #         messages=messages,
-        #         temperature=temperature or settings.temperature,
-        #         max_tokens=max_tokens or settings.max_tokens,
-        #         api_key=settings.hf_key,
-        #     )
-        # else:
+        metrics.incr("llm_errors", model=kwargs["model"])
         raise RuntimeError(f"LLM call failed: {e}")
 
-    content = resp.choices[0].message["content"]
-    usage = getattr(resp, "usage", None) or {}
+    result = _unpack(resp, answered_by)
+    cost.record_usage(answered_by, result["usage"], prompt=messages, completion="\n".join(result["choices"]))
+    if cache is not None:
+        cache.put(key, _storable(result))
+    return result
+
+
+@tracing.traced("llm.chat")
+async def achat(
+    messages: List[Dict[str, str]],
+    *,
+    temperature: float | None = None,
+    max_tokens: int | None = None,
+    model: str | None = None,
+    use_cache: bool = True,
+    cache_slot: int = 0,
+    n: int = 1,
+    json_schema: Dict[str, Any] | None = None,
+) -> Dict[str, Any]:
+    """
+    Async sibling of chat(), built on LiteLLM's acompletion.
+    Lets callers fan out several requests on one event loop.
+    """
+    kwargs = _request_kwargs(messages, temperature, max_tokens, model, n, json_schema)
+    metrics.incr("llm_calls", model=kwargs["model"])
+
+    cache = get_cache() if use_cache else None
+    if cache is not None:
+        key = _cache_key(kwargs, cache_slot)
+        hit = cache.get(key)
+        if hit is not None:
+            cost.record_usage(hit.get("model") or kwargs["model"], cached=True)
+            return _cached(hit)
+
+    try:
+        answered_by, resp = await _acomplete(kwargs)
+    except Exception as e:
+        metrics.incr("llm_errors", model=kwargs["model"])
+        raise RuntimeError(f"LLM call failed: {e}")
+
+    result = _unpack(resp, answered_by)
+    cost.record_usage(answered_by, result["usage"], prompt=messages, completion="\n".join(result["choices"]))
+    if cache is not None:
+        cache.put(key, _storable(result))
+    return result
+
+
+def chat_stream(
+    messages: List[Dict[str, str]],
+    *,
+    temperature: float | None = None,
+    max_tokens: int | None = None,
+    model: str | None = None,
+    use_cache: bool = True,
+    cache_slot: int = 0,
+) -> Iterator[str]:
+    """
+    Streaming variant of chat(): yields content deltas as they arrive.
+    Time-to-first-token is recorded as the "llm_ttft_seconds" metric.
+    A cached response is yielded as a single chunk.
+    """
+    kwargs = _request_kwargs(messages, temperature, max_tokens, model)
+    metrics.incr("llm_calls", model=kwargs["model"])
+
+    cache = get_cache() if use_cache else None
+    if cache is not None:
+        key = _cache_key(kwargs, cache_slot)
+        hit = cache.get(key)
+        if hit is not None:
+            cost.record_usage(hit.get("model") or kwargs["model"], cached=True)
+            yield hit["content"]
+            return
+
+    started = time.perf_counter()
+    parts = []
+    # Not attached: the caller's code runs between our yields
+    with tracing.span("llm.stream", attach=False, model=kwargs["model"]) as span:
+        try:
+            answered_by, stream = _complete({**kwargs, "stream": True})
+        except Exception as e:
+            metrics.incr("llm_errors", model=kwargs["model"])
+            raise RuntimeError(f"LLM call failed: {e}")
+
+        for chunk in stream:
+            delta = _delta(chunk)
+            if not delta:
+                continue
+            if not parts:
+                ttft = time.perf_counter() - started
+                metrics.observe("llm_ttft_seconds", ttft)
+                span.set(ttft_seconds=round(ttft, 4))
+            parts.append(delta)
+            yield delta
+
+    # Streams carry no usage, so the ledger gets a tiktoken estimate
+    cost.record_usage(answered_by, prompt=messages, completion="".join(parts))
+    if cache is not None and parts:
+        cache.put(key, {"content": "".join(parts), "usage": {}, "model": answered_by})
+
+
+async def achat_stream(
+    messages: List[Dict[str, str]],
+    *,
+    temperature: float | None = None,
+    max_tokens: int | None = None,
+    model: str | None = None,
+    use_cache: bool = True,
+    cache_slot: int = 0,
+) -> AsyncIterator[str]:
+    """
+    Async variant of chat_stream().
+    """
+    kwargs = _request_kwargs(messages, temperature, max_tokens, model)
+    metrics.incr("llm_calls", model=kwargs["model"])
+
+    cache = get_cache() if use_cache else None
+    if cache is not None:
+        key = _cache_key(kwargs, cache_slot)
+        hit = cache.get(key)
+        if hit is not None:
+            cost.record_usage(hit.get("model") or kwargs["model"], cached=True)
+            yield hit["content"]
+            return
+
+    started = time.perf_counter()
+    parts = []
+    # Not attached: the caller's code runs between our yields
+    with tracing.span("llm.stream", attach=False, model=kwargs["model"]) as span:
+        try:
+            answered_by, stream = await _acomplete({**kwargs, "stream": True})
+        except Exception as e:
+            metrics.incr("llm_errors", model=kwargs["model"])
+            raise RuntimeError(f"LLM call failed: {e}")
+
+        async for chunk in stream:
+            delta = _delta(chunk)
+            if not delta:
+                continue
+            if not parts:
+                ttft = time.perf_counter() - started
+                metrics.observe("llm_ttft_seconds", ttft)
+                span.set(ttft_seconds=round(ttft, 4))
+            parts.append(delta)
+            yield delta
 
-    return {"content": content, "usage": usage}
+    # Streams carry no usage, so the ledger gets a tiktoken estimate
+    cost.record_usage(answered_by, prompt=messages, completion="".join(parts))
+    if cache is not None and parts:
+        cache.put(key, {"content": "".join(parts), "usage": {}, "model": answered_by})
@@ -0,0 +1,177 @@
+# src/utils/cache.py
+"""
+Content-addressed response cache for LLM calls.
+Two tiers: an in-memory LRU in front of an optional SQLite file.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from src.config import settings
+from src.utils import metrics
+
+
+def make_key(**inputs: Any) -> str:
+    """
+    Canonical hash of the call inputs (model, messages, temperature, max_tokens, ...).
+    """
+    canonical = json.dumps(inputs, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        *,
+        ttl: float = 3600,
+        max_entries: int = 512,
+        max_disk_bytes: int = 50 * 1024 * 1024,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory: "OrderedDict[str, tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "evictions": 0}
+
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+                " expires REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[Dict]:
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > now:
+                    self._memory.move_to_end(key)
+                    self._stats["hits"] += 1
+                    self._stats["memory_hits"] += 1
+                    metrics.incr("llm_cache_hits", tier="memory")
+                    return value
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if row[1] > now:
+                        self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        value = json.loads(row[0])
+                        self._remember(key, row[1], value)
+                        self._stats["hits"] += 1
+                        self._stats["disk_hits"] += 1
+                        metrics.incr("llm_cache_hits", tier="disk")
+                        return value
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self._stats["misses"] += 1
+            metrics.incr("llm_cache_misses")
+            return None
+
+    def put(self, key: str, value: Dict) -> None:
+        now = time.time()
+        expires = now + self.ttl
+
+        with self._lock:
+            self._remember(key, expires, value)
+
+            if self._db is not None:
+                blob = json.dumps(value, default=str)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, size, expires, accessed)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (key, blob, len(blob), expires, now),
+                )
+                self._evict_disk(now)
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            if self._db is not None:
+                count, size = self._db.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+                ).fetchone()
+                stats["disk_entries"] = count
+                stats["disk_bytes"] = size
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def _remember(self, key: str, expires: float, value: Dict) -> None:
+        self._memory[key] = (expires, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _evict_disk(self, now: float) -> None:
+        self._db.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+
+        # Drop least recently used rows until we're back under budget
+        for key, size in self._db.execute(
+            "SELECT key, size FROM responses ORDER BY accessed ASC"
+        ).fetchall():
+            if total <= self.max_disk_bytes:
+                break
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            self._stats["evictions"] += 1
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[ResponseCache]:
+    """
+    Returns the process-wide response cache, or None if caching is disabled.
+    """
+    global _cache
+
+    if not settings.cache_enabled:
+        return None
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(
+                settings.cache_path or None,
+                ttl=settings.cache_ttl,
+                max_entries=settings.cache_max_entries,
+                max_disk_bytes=settings.cache_max_bytes,
+            )
+        return _cache
@@ -1,37 +1,119 @@
 # src/utils/cost.py
-from typing import Dict, Any
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 
-# Real Google AI Studio rates (USD per 1k tokens)
-_GEMINI_RATES = {
+from src.utils import metrics
+
+# Published list prices (USD per 1k tokens)
+_RATES = {
     "gemini-1.5-flash": {"input_per_1k": 0.000075, "output_per_1k": 0.0003},
+    "gemini-1.5-flash-8b": {"input_per_1k": 0.0000375, "output_per_1k": 0.00015},
     "gemini-1.5-pro": {"input_per_1k": 0.00125, "output_per_1k": 0.005},
+    "gpt-4o-mini": {"input_per_1k": 0.00015, "output_per_1k": 0.0006},
+    "gpt-4o": {"input_per_1k": 0.0025, "output_per_1k": 0.01},
+    "claude-3-haiku": {"input_per_1k": 0.00025, "output_per_1k": 0.00125},
+    "claude-3-5-sonnet": {"input_per_1k": 0.003, "output_per_1k": 0.015},
+    # Serverless Inference API: billed by compute time, not tokens
+    "huggingface": {"input_per_1k": 0.0, "output_per_1k": 0.0},
 }
 
+_ZERO_USAGE = {"input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0, "calls": 0, "cached_calls": 0}
+
+
 def _normalize_model_key(model: str) -> str:
     m = (model or "").lower()
+    if m.startswith("huggingface/"):
+        return "huggingface"
+    m = m.split("/")[-1]
+
+    # Longest known prefix wins, so "gpt-4o-mini-2024-07-18" maps to gpt-4o-mini
+    for key in sorted(_RATES, key=len, reverse=True):
+        if m.startswith(key):
+            return key
+
+    if "flash-8b" in m:
+        return "gemini-1.5-flash-8b"
     if "flash" in m:
         return "gemini-1.5-flash"
     if "pro" in m:
         return "gemini-1.5-pro"
     return "gemini-1.5-flash"  # default to Flash if unspecified
 
+
+def _field(usage: Any, *names: str) -> int:
+    for name in names:
+        value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+        if value:
+            return int(value)
+    return 0
+
+
+def normalize_usage(usage: Any) -> Tuple[int, int]:
+    """
+    (input_tokens, output_tokens) from any provider's usage shape:
+    LiteLLM/OpenAI (prompt_tokens/completion_tokens), Gemini usage_metadata
+    (prompt_token_count/candidates_token_count) or Anthropic (input_tokens/output_tokens).
+    """
+    if not usage:
+        return 0, 0
+    return (
+        _field(usage, "prompt_tokens", "prompt_token_count", "input_tokens"),
+        _field(usage, "completion_tokens", "candidates_token_count", "output_tokens"),
+    )
+
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def get_encoding():
+    """
+    The shared tiktoken encoding (cl100k_base), or None if tiktoken is unavailable.
+    """
+    global _encoding
+
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                _encoding = False
+    return _encoding or None
+
+
+def count_tokens(text: Any) -> int:
+    """
+    Token count via tiktoken (cl100k_base); ~4 characters per token if it's unavailable.
+    Accepts a string or a list of chat messages.
+    """
+    if isinstance(text, list):
+        return sum(count_tokens(m.get("content", "")) + 4 for m in text)
+    text = str(text or "")
+
+    encoding = get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
 def estimate_cost(model: str, usage_metadata: Any) -> Dict[str, Any]:
     """
-    Estimate cost directly from Gemini's usage_metadata.
-    usage_metadata is typically response.usage_metadata from google-generativeai.
+    Estimate cost from a usage record of any supported shape (see normalize_usage).
 
     Example structure:
     {
-        "prompt_token_count": 120,
-        "candidates_token_count": 380,
-        "total_token_count": 500
+        "prompt_tokens": 120,
+        "completion_tokens": 380,
+        "total_tokens": 500
     }
     """
     key = _normalize_model_key(model)
-    rates = _GEMINI_RATES[key]
+    rates = _RATES[key]
 
-    input_tokens = int(getattr(usage_metadata, "prompt_token_count", 0) or 0)
-    output_tokens = int(getattr(usage_metadata, "candidates_token_count", 0) or 0)
+    input_tokens, output_tokens = normalize_usage(usage_metadata)
 
     cost = (input_tokens / 1000.0) * rates["input_per_1k"] + \
            (output_tokens / 1000.0) * rates["output_per_1k"]
@@ -43,6 +125,108 @@ def estimate_cost(model: str, usage_metadata: Any) -> Dict[str, Any]:
         "cost_usd": round(cost, 8),
     }
 
+
+class UsageLedger:
+    """
+    Collects normalized token counts and cost for every LLM call of a request.
+    """
+
+    def __init__(self):
+        self.entries: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, model: str, usage: Any = None, *,
+               estimated: bool = False, cached: bool = False) -> Dict[str, Any]:
+        entry = estimate_cost(model, usage)
+        if cached:
+            # Served from cache: nothing was billed
+            entry.update(input_tokens=0, output_tokens=0, cost_usd=0.0)
+        entry.update(stage=stage, estimated=estimated, cached=cached)
+        with self._lock:
+            self.entries.append(entry)
+        return entry
+
+    @staticmethod
+    def _add(total: Dict[str, Any], entry: Dict[str, Any]) -> None:
+        total["input_tokens"] += entry["input_tokens"]
+        total["output_tokens"] += entry["output_tokens"]
+        total["cost_usd"] = round(total["cost_usd"] + entry["cost_usd"], 8)
+        total["calls"] += 1
+        total["cached_calls"] += int(entry["cached"])
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        {"total": {...}, "stages": {stage: {...}}, "models": {model: {...}}}
+        """
+        with self._lock:
+            entries = list(self.entries)
+
+        total = dict(_ZERO_USAGE)
+        stages: Dict[str, Dict[str, Any]] = {}
+        models: Dict[str, Dict[str, Any]] = {}
+        for entry in entries:
+            self._add(total, entry)
+            self._add(stages.setdefault(entry["stage"], dict(_ZERO_USAGE)), entry)
+            self._add(models.setdefault(entry["model"], dict(_ZERO_USAGE)), entry)
+
+        return {"total": total, "stages": stages, "models": models}
+
+
+_ledger: ContextVar[Optional[UsageLedger]] = ContextVar("usage_ledger", default=None)
+_stage: ContextVar[str] = ContextVar("usage_stage", default="other")
+
+
+@contextmanager
+def track(ledger: UsageLedger) -> Iterator[UsageLedger]:
+    """
+    Routes every record_usage() in this context (and tasks/threads spawned from it
+    with a copied context) into `ledger`.
+    """
+    token = _ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _ledger.reset(token)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    token = _stage.set(name)
+    try:
+        yield
+    finally:
+        _stage.reset(token)
+
+
+def record_usage(model: str, usage: Any = None, *, prompt: Any = None,
+                 completion: Any = None, cached: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Adds one call to the active ledger, if any. When the provider reported no
+    usage, tokens are estimated from the prompt and completion text.
+    """
+    ledger = _ledger.get()
+    if ledger is None:
+        if not cached:
+            _observe_tokens(model, *normalize_usage(usage))
+        return None
+
+    estimated = False
+    if not cached and normalize_usage(usage) == (0, 0) and (prompt or completion):
+        usage = {"prompt_tokens": count_tokens(prompt), "completion_tokens": count_tokens(completion)}
+        estimated = True
+
+    entry = ledger.record(_stage.get(), model, usage, estimated=estimated, cached=cached)
+    if not cached:
+        _observe_tokens(model, entry["input_tokens"], entry["output_tokens"])
+    return entry
+
+
+def _observe_tokens(model: str, input_tokens: int, output_tokens: int) -> None:
+    if input_tokens or output_tokens:
+        metrics.observe("llm_input_tokens", input_tokens, model=model)
+        metrics.observe("llm_output_tokens", output_tokens, model=model)
+
+
 if __name__ == "__main__":
     # Example with fake usage metadata object
     class FakeUsage:
@@ -52,3 +236,4 @@ if __name__ == "__main__":
 
     usage = FakeUsage()
     print(estimate_cost("gemini-1.5-flash", usage))
+    print(estimate_cost("gpt-4o-mini", {"prompt_tokens": 120, "completion_tokens": 380}))
@@ -0,0 +1,122 @@
+# src/utils/hedging.py
+"""
+Hedged requests with failover: run the first attempt, start the next one if
+it is slower than `hedge_after` seconds (at most one hedge) or as soon as an
+attempt fails, and return the first success. Losers are cancelled.
+"""
+
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from src.utils import metrics
+
+# Shared by sync callers; a thread that already started can't be interrupted,
+# so a losing sync attempt runs to completion and its result is dropped.
+_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge")
+
+
+def first_success(
+    attempts: List[Callable[[], Any]],
+    hedge_after: Optional[float] = None,
+) -> Tuple[int, Any]:
+    """
+    Returns (index of the winning attempt, its result).
+    Raises the last error if every attempt fails.
+    """
+    if len(attempts) == 1:
+        return 0, attempts[0]()
+
+    pending: Dict[Future, int] = {}
+    launched = 0
+    hedged = False
+    last_error: Optional[BaseException] = None
+
+    def launch() -> None:
+        nonlocal launched
+        pending[_pool.submit(attempts[launched])] = launched
+        launched += 1
+
+    launch()
+    while pending:
+        timeout = hedge_after if not hedged and launched < len(attempts) else None
+        done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+        if not done:
+            # Slow primary: race it against the next candidate
+            hedged = True
+            metrics.incr("llm_hedges")
+            launch()
+            continue
+
+        for fut in done:
+            index = pending.pop(fut)
+            try:
+                result = fut.result()
+            except Exception as e:
+                last_error = e
+                if launched < len(attempts):
+                    metrics.incr("llm_failovers")
+                    launch()
+                continue
+
+            for other in pending:
+                other.cancel()
+            if index:
+                metrics.incr("llm_hedge_wins" if hedged else "llm_failover_wins")
+            return index, result
+
+    raise last_error
+
+
+async def afirst_success(
+    attempts: List[Callable[[], Awaitable[Any]]],
+    hedge_after: Optional[float] = None,
+) -> Tuple[int, Any]:
+    """
+    Async variant of first_success(); losing attempts are cancelled outright.
+    """
+    if len(attempts) == 1:
+        return 0, await attempts[0]()
+
+    pending: Dict[asyncio.Task, int] = {}
+    launched = 0
+    hedged = False
+    last_error: Optional[BaseException] = None
+
+    def launch() -> None:
+        nonlocal launched
+        pending[asyncio.ensure_future(attempts[launched]())] = launched
+        launched += 1
+
+    launch()
+    try:
+        while pending:
+            timeout = hedge_after if not hedged and launched < len(attempts) else None
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+            if not done:
+                hedged = True
+                metrics.incr("llm_hedges")
+                launch()
+                continue
+
+            for task in done:
+                index = pending.pop(task)
+                try:
+                    result = task.result()
+                except Exception as e:
+                    last_error = e
+                    if launched < len(attempts):
+                        metrics.incr("llm_failovers")
+                        launch()
+                    continue
+
+                if index:
+                    metrics.incr("llm_hedge_wins" if hedged else "llm_failover_wins")
+                return index, result
+    finally:
+        for task in pending:
+            task.cancel()
+
+    raise last_error
@@ -0,0 +1,267 @@
+# src/utils/history.py
+"""
+Local generation history: every pipeline run (plan, variants, moderation
+verdicts, hashtags, usage, timings) in SQLite, with an FTS5 index over the
+posts for fast search. Writes are queued and committed in batches by a
+background thread, so recording a run never blocks the request.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Any, Dict, List, Optional
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Runs written per transaction, and the longest a queued run waits for a batch to fill
+BATCH_SIZE = 50
+FLUSH_INTERVAL = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    topic TEXT NOT NULL,
+    tone TEXT, audience TEXT, length TEXT,
+    plan TEXT, news TEXT, diversity TEXT, timings TEXT, usage TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_created ON runs(created);
+
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    variant INTEGER NOT NULL,
+    topic TEXT NOT NULL,
+    text TEXT NOT NULL,
+    draft TEXT,
+    hashtags TEXT,
+    verdict TEXT
+);
+CREATE INDEX IF NOT EXISTS posts_run ON posts(run_id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+    text, hashtags, topic, content='posts', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS posts_ai AFTER INSERT ON posts BEGIN
+    INSERT INTO posts_fts(rowid, text, hashtags, topic) VALUES (new.id, new.text, new.hashtags, new.topic);
+END;
+CREATE TRIGGER IF NOT EXISTS posts_ad AFTER DELETE ON posts BEGIN
+    INSERT INTO posts_fts(posts_fts, rowid, text, hashtags, topic)
+    VALUES ('delete', old.id, old.text, old.hashtags, old.topic);
+END;
+"""
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class HistoryStore:
+    def __init__(self, path: str):
+        self.path = path
+        with closing(_connect(path)) as conn:
+            conn.executescript(SCHEMA)
+
+        self._queue: "queue.Queue[Optional[Dict]]" = queue.Queue()
+        self._pending = 0
+        self._done = threading.Condition()
+        self._worker = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._worker.start()
+
+    # --- writes ---
+
+    def record(self, run: Dict[str, Any]) -> None:
+        """
+        Queues a run for the background writer; returns immediately.
+        """
+        with self._done:
+            self._pending += 1
+        self._queue.put({**run, "created": run.get("created", time.time())})
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """
+        Waits until every queued run is committed.
+        """
+        with self._done:
+            return self._done.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._worker.join(timeout=10)
+
+    def _run(self) -> None:
+        conn = _connect(self.path)
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            while len(batch) < BATCH_SIZE:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._write(conn, batch)
+            with self._done:
+                self._pending -= len(batch)
+                self._done.notify_all()
+        conn.close()
+
+    @staticmethod
+    def _write(conn: sqlite3.Connection, batch: List[Dict]) -> None:
+        try:
+            with conn:
+                for run in batch:
+                    plan = run.get("plan") or {}
+                    cur = conn.execute(
+                        "INSERT INTO runs (created, topic, tone, audience, length, plan, news, diversity, timings, usage)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            run["created"], run.get("topic") or plan.get("topic", ""),
+                            plan.get("tone"), plan.get("audience"), plan.get("length"),
+                            *(json.dumps(run.get(k), default=str) for k in ("plan", "news", "diversity", "timings", "usage")),
+                        ),
+                    )
+                    run_id = cur.lastrowid
+                    finals = run.get("final") or []
+                    drafts = run.get("drafts") or []
+                    tags = run.get("hashtags") or []
+                    verdicts = run.get("verdicts") or []
+                    conn.executemany(
+                        "INSERT INTO posts (run_id, variant, topic, text, draft, hashtags, verdict)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [
+                            (
+                                run_id, i, run.get("topic") or plan.get("topic", ""), text,
+                                drafts[i] if i < len(drafts) else None,
+                                tags[i] if i < len(tags) else None,
+                                json.dumps(verdicts[i]) if i < len(verdicts) and verdicts[i] else None,
+                            )
+                            for i, text in enumerate(finals)
+                        ],
+                    )
+        except sqlite3.Error as e:
+            # History is best effort; never take the writer thread down
+            logger.warning("Failed to write %d history runs: %s", len(batch), e)
+
+    # --- reads ---
+
+    @staticmethod
+    def _fts_query(text: str) -> str:
+        # Quote every term so user input can't inject FTS syntax; prefix-match the last one
+        terms = re.findall(r"\w+", text)
+        if not terms:
+            return ""
+        quoted = ['"' + t.replace('"', '""') + '"' for t in terms]
+        quoted[-1] += "*"
+        return " ".join(quoted)
+
+    def search(self, text: str, limit: int = 20, offset: int = 0) -> List[Dict]:
+        """
+        Full-text search over post text, hashtags and topic, best matches first.
+        """
+        match = self._fts_query(text)
+        if not match:
+            return self.recent(limit)
+
+        with closing(_connect(self.path)) as conn:
+            rows = conn.execute(
+                "SELECT p.id, p.run_id, p.variant, p.topic, p.text, p.hashtags, p.verdict, r.created,"
+                " snippet(posts_fts, 0, '**', '**', '…', 24) AS snippet"
+                " FROM posts_fts JOIN posts p ON p.id = posts_fts.rowid JOIN runs r ON r.id = p.run_id"
+                " WHERE posts_fts MATCH ? ORDER BY bm25(posts_fts) LIMIT ? OFFSET ?",
+                (match, limit, offset),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def recent(self, limit: int = 20, before_id: Optional[int] = None) -> List[Dict]:
+        """
+        Newest posts first; pass the last seen id as before_id for the next page.
+        """
+        with closing(_connect(self.path)) as conn:
+            rows = conn.execute(
+                "SELECT p.id, p.run_id, p.variant, p.topic, p.text, p.hashtags, p.verdict, r.created"
+                " FROM posts p JOIN runs r ON r.id = p.run_id"
+                " WHERE p.id < ? ORDER BY p.id DESC LIMIT ?",
+                (before_id if before_id is not None else 2 ** 62, limit),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def get_run(self, run_id: int) -> Optional[Dict]:
+        with closing(_connect(self.path)) as conn:
+            run = conn.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+            if run is None:
+                return None
+            posts = conn.execute(
+                "SELECT variant, text, draft, hashtags, verdict FROM posts WHERE run_id = ? ORDER BY variant",
+                (run_id,),
+            ).fetchall()
+
+        data = dict(run)
+        for key in ("plan", "news", "diversity", "timings", "usage"):
+            data[key] = json.loads(data[key]) if data[key] else None
+        data["posts"] = [dict(p) for p in posts]
+        return data
+
+    def count(self) -> int:
+        with closing(_connect(self.path)) as conn:
+            return conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+
+
+_store: Optional[HistoryStore] = None
+_store_failed = False
+_store_lock = threading.Lock()
+
+
+def get_store() -> Optional[HistoryStore]:
+    """
+    The process-wide history store, or None if history is disabled. A store
+    that can't be opened (bad path, SQLite without FTS5) disables history for
+    the rest of the process instead of failing the caller.
+    """
+    global _store, _store_failed
+
+    if not settings.history_enabled:
+        return None
+
+    with _store_lock:
+        if _store is None and not _store_failed:
+            try:
+                _store = HistoryStore(settings.history_path)
+            except (sqlite3.Error, OSError) as e:
+                _store_failed = True
+                logger.warning("History disabled: can't open %s: %s", settings.history_path, e)
+                return None
+            atexit.register(_store.flush)
+        return _store
+
+
+def record_run(topic: str, result: Dict[str, Any], verdicts: Optional[List[Dict]] = None) -> None:
+    """
+    Queues a pipeline result (see graph.run_pipeline) for the history store.
+    """
+    store = get_store()
+    if store is not None:
+        store.record({**result, "topic": topic, "verdicts": verdicts or []})
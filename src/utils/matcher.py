@@ -0,0 +1,79 @@
+# src/utils/matcher.py
+"""
+Aho-Corasick multi-pattern matcher: finds every occurrence of a fixed
+set of terms in one pass over the text, regardless of how many terms there are.
+"""
+
+from collections import deque
+from typing import Dict, Iterable, List, Tuple
+
+
+class TermMatcher:
+    def __init__(self, terms: Iterable[str], whole_words: bool = True):
+        self.whole_words = whole_words
+
+        # Trie as parallel lists: goto transitions, failure links, terms ending here
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[str]] = [[]]
+
+        for term in terms:
+            term = term.strip().lower()
+            if term:
+                self._add(term)
+        self._build()
+
+    def _add(self, term: str) -> None:
+        node = 0
+        for ch in term:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        if term not in self._out[node]:
+            self._out[node].append(term)
+
+    def _build(self) -> None:
+        # Breadth-first, so failure links always point to already-finished nodes.
+        # Depth-1 nodes keep their failure link to the root.
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text: str) -> List[Tuple[int, str]]:
+        """
+        Returns (start_index, term) for every match in text.
+        """
+        text = text.lower()
+        matches = []
+        node = 0
+
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+
+            for term in self._out[node]:
+                start = i - len(term) + 1
+                if self.whole_words and not self._bounded(text, start, i + 1):
+                    continue
+                matches.append((start, term))
+
+        return matches
+
+    @staticmethod
+    def _bounded(text: str, start: int, end: int) -> bool:
+        before = text[start - 1] if start > 0 else " "
+        after = text[end] if end < len(text) else " "
+        return not before.isalnum() and not after.isalnum()
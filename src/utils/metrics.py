@@ -0,0 +1,204 @@
+# src/utils/metrics.py
+"""
+In-process metrics: named observations (latencies, sizes) with simple summaries,
+and monotonically increasing counters. Both accept optional labels, e.g.
+observe("llm_latency_seconds", 1.2, model="gemini-1.5-flash").
+
+Observations also feed cumulative histograms, and everything can be exported
+in the Prometheus text format (export_prometheus, start_http_server).
+"""
+
+import threading
+from bisect import bisect_left
+from collections import deque
+from typing import Deque, Dict, FrozenSet, List, Optional, Tuple
+
+# Most recent observations kept per metric
+WINDOW = 1000
+
+# Histogram bucket upper bounds, picked by metric name
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+DEFAULT_BUCKETS = (1, 10, 100, 1000, 10000, 100000)
+
+_Key = Tuple[str, FrozenSet[Tuple[str, str]]]
+
+_series: Dict[_Key, Deque[float]] = {}
+_counters: Dict[_Key, float] = {}
+# Per series: [bucket counts..., +Inf count], running sum
+_histograms: Dict[_Key, Tuple[List[int], List[float]]] = {}
+_lock = threading.Lock()
+
+
+def _key(name: str, labels: Dict[str, str]) -> _Key:
+    return name, frozenset((k, str(v)) for k, v in labels.items())
+
+
+def _buckets(name: str) -> Tuple[float, ...]:
+    if name.endswith("_seconds"):
+        return SECONDS_BUCKETS
+    if "tokens" in name:
+        return TOKEN_BUCKETS
+    return DEFAULT_BUCKETS
+
+
+def observe(name: str, value: float, **labels: str) -> None:
+    """
+    Record one observation for a metric, e.g. observe("llm_ttft_seconds", 0.42).
+    """
+    key = _key(name, labels)
+    value = float(value)
+    with _lock:
+        series = _series.get(key)
+        if series is None:
+            series = _series[key] = deque(maxlen=WINDOW)
+            _histograms[key] = ([0] * (len(_buckets(name)) + 1), [0.0])
+        series.append(value)
+        counts, total = _histograms[key]
+        counts[bisect_left(_buckets(name), value)] += 1
+        total[0] += value
+
+
+def incr(name: str, amount: float = 1.0, **labels: str) -> None:
+    """
+    Increase a counter, e.g. incr("llm_hedges", model="gemini-1.5-flash").
+    """
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + amount
+
+
+def counter(name: str, **labels: str) -> float:
+    with _lock:
+        return _counters.get(_key(name, labels), 0.0)
+
+
+def counter_total(name: str) -> float:
+    """
+    A counter summed over all of its label sets.
+    """
+    with _lock:
+        return sum(v for (n, _), v in _counters.items() if n == name)
+
+
+def _percentile(ordered: list, q: float) -> float:
+    idx = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def percentile(name: str, q: float, min_count: int = 1, **labels: str) -> Optional[float]:
+    """
+    The q-quantile (0..1) of the recent window, or None with fewer than min_count samples.
+    """
+    with _lock:
+        ordered = sorted(_series.get(_key(name, labels), ()))
+    if len(ordered) < max(1, min_count):
+        return None
+    return _percentile(ordered, q)
+
+
+def summary(name: str, **labels: str) -> Dict[str, float]:
+    """
+    Count, mean and p50/p95/p99 over the recent window of a metric.
+    """
+    with _lock:
+        ordered = sorted(_series.get(_key(name, labels), ()))
+
+    if not ordered:
+        return {"count": 0}
+
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "p50": _percentile(ordered, 0.50),
+        "p95": _percentile(ordered, 0.95),
+        "p99": _percentile(ordered, 0.99),
+        "max": ordered[-1],
+    }
+
+
+# --- Prometheus export ---
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: FrozenSet[Tuple[str, str]], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = sorted(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def export_prometheus(namespace: str = "") -> str:
+    """
+    Every counter and histogram in the Prometheus text exposition format.
+    """
+    with _lock:
+        counters = sorted(_counters.items(), key=lambda kv: (kv[0][0], sorted(kv[0][1])))
+        histograms = sorted(
+            ((k, list(c), t[0]) for k, (c, t) in _histograms.items()),
+            key=lambda item: (item[0][0], sorted(item[0][1])),
+        )
+
+    lines: List[str] = []
+    typed = set()
+    for (name, labels), value in counters:
+        metric = namespace + (name if name.endswith("_total") else name + "_total")
+        if metric not in typed:
+            typed.add(metric)
+            lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric}{_labels(labels)} {value:g}")
+
+    for (name, labels), counts, total in histograms:
+        metric = namespace + name
+        if metric not in typed:
+            typed.add(metric)
+            lines.append(f"# TYPE {metric} histogram")
+        cumulative = 0
+        for bound, count in zip(list(_buckets(name)) + ["+Inf"], counts):
+            cumulative += count
+            le = bound if isinstance(bound, str) else f"{bound:g}"
+            lines.append(f"{metric}_bucket{_labels(labels, ('le', le))} {cumulative}")
+        lines.append(f"{metric}_sum{_labels(labels)} {total:g}")
+        lines.append(f"{metric}_count{_labels(labels)} {cumulative}")
+
+    return "\n".join(lines) + "\n"
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_http_server(port: int, host: str = "0.0.0.0"):
+    """
+    Serves GET /metrics (Prometheus text) from a daemon thread; once per process,
+    so it is safe to call on every Streamlit rerun. Returns the server.
+    """
+    global _server
+
+    with _server_lock:
+        if _server is not None:
+            return _server
+
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = export_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        _server = ThreadingHTTPServer((host, port), Handler)
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+        return _server
@@ -4,14 +4,72 @@ Runs safety and content moderation checks on LLM outputs
 using Gemini (Google AI) with GEMINI_API_KEY.
 """
 
-import google.generativeai as genai
-from src.config import settings
+import contextvars
+import hashlib
+import json
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
 
-# Configure Gemini
-genai.configure(api_key=settings.gemini_key)
+from src.config import settings
+from src.utils import cost, metrics, ratelimit, tracing
+from src.utils.matcher import TermMatcher
+from src.utils.text import parse_json
 
 MODERATION_MODEL = "gemini-1.5-flash-8b"
 
+# Verdicts kept in memory, keyed by a hash of the normalized post text
+VERDICT_CACHE_SIZE = 1024
+
+# Up to this many posts are moderated in one structured request;
+# larger batches are split into concurrent single-post calls instead.
+MODERATION_BATCH_LIMIT = 5
+
+# Local pre-moderation: only clearly safe text skips the LLM. Text is SAFE
+# locally on positive evidence (enough professional vocabulary, see
+# MODERATION_SAFE_MIN_HITS / MODERATION_SAFE_MIN_DENSITY) and no red flags;
+# everything else is UNSURE and goes to the LLM, including unsafe-term hits,
+# which only suggest categories ("revenge porn policy" is a legitimate topic).
+# Extend the lists via MODERATION_TERMS_PATH (JSON file shaped like
+# {"unsafe": {"category": [...]}, "sensitive": [...], "safe": [...]}).
+UNSAFE_TERMS = {
+    "self-harm": ["kill yourself", "kys", "go die", "you should die", "cut yourself"],
+    "terrorism": ["join isis", "join al-qaeda", "how to make a bomb", "build a bomb", "pipe bomb"],
+    "hate": ["heil hitler", "white power", "gas the", "ethnic cleansing", "subhuman"],
+    "sexual": ["porn", "pornography", "nudes", "xxx", "onlyfans"],
+    "violence": ["shoot them all", "mass shooting", "i will kill", "beat them to death"],
+}
+
+SENSITIVE_TERMS = [
+    "kill", "killed", "killing", "murder", "attack", "shoot", "shooting", "gun", "guns", "weapon",
+    "weapons", "bomb", "explosive", "terror", "terrorist", "terrorism", "suicide", "self-harm",
+    "die", "death", "blood", "violence", "violent", "abuse", "hate", "racist", "racism", "nazi",
+    "slur", "sex", "sexual", "nude", "naked", "drugs", "cocaine", "heroin", "overdose", "rape",
+    "extremist", "jihad", "massacre", "genocide", "torture",
+]
+
+SAFE_TERMS = [
+    "business", "career", "careers", "team", "teams", "customer", "customers", "client", "clients",
+    "product", "products", "market", "marketing", "sales", "strategy", "growth", "revenue", "data",
+    "insight", "insights", "leadership", "leader", "leaders", "management", "manager", "project",
+    "projects", "company", "companies", "industry", "innovation", "technology", "software",
+    "engineering", "engineers", "hiring", "learning", "skills", "experience", "workflow", "process",
+    "productivity", "collaboration", "feedback", "results", "launch", "brand", "network", "networking",
+    "conference", "webinar", "community", "partners", "partnership", "startup", "startups", "ai",
+    "automation", "analytics", "quality", "culture", "mentor", "mentoring", "opportunity",
+    "opportunities", "goals", "success", "impact", "value", "research", "platform", "solution",
+    "solutions", "development", "professional", "professionals", "organization", "organizations",
+    "employees", "colleagues", "role", "roles", "job", "jobs", "work", "workplace", "remote",
+    "meeting", "meetings", "investment", "finance", "economy", "pricing", "experiment", "experiments",
+]
+
+# Heuristics that send otherwise clean text to the LLM anyway
+PREFILTER_MAX_CAPS_RATIO = 0.6      # shouting
+PREFILTER_MIN_LATIN_RATIO = 0.85    # term lists only cover English
+
 GUARDRAIL_SYS = """
 You are a moderation agent for LinkedIn posts.
 
@@ -25,38 +83,449 @@ Rules:
 - Do not add explanations, metadata, or JSON. Only return the final post text.
 """
 
-def moderate_post(text) -> str:
+GUARDRAIL_BATCH_SYS = """
+You are a moderation agent for LinkedIn posts.
+You receive a JSON array of posts and apply these rules to each post independently.
+
+Definitions:
+- SAFE = normal professional, educational, or marketing content.
+- UNSAFE = contains hate speech, violence, explicit sexual content, terrorism, or encouragement of self-harm. Anything innappropriate should not make it to the output.
+
+Rules:
+- If SAFE: keep the post text exactly as it is.
+- If UNSAFE: rewrite the text into a safe, professional LinkedIn post. If it is not remotely related to any field, replace it with a message telling the user to not make NSFW posts.
+- Return only a JSON array of strings with one entry per input post, in the same order.
+"""
+
+VERDICT_SYS = """
+You are a moderation classifier for LinkedIn posts.
+
+Definitions:
+- SAFE = normal professional, educational, or marketing content.
+- UNSAFE = contains hate speech, violence, explicit sexual content, terrorism, or encouragement of self-harm.
+
+Reply with a single line and nothing else:
+- SAFE
+- UNSAFE: <comma-separated categories from: hate, violence, sexual, terrorism, self-harm, other>
+"""
+
+VERDICT_BATCH_SYS = """
+You are a moderation classifier for LinkedIn posts.
+You receive a JSON array of posts and classify each post independently.
+
+Definitions:
+- SAFE = normal professional, educational, or marketing content.
+- UNSAFE = contains hate speech, violence, explicit sexual content, terrorism, or encouragement of self-harm.
+
+Return only a JSON array of strings with one entry per input post, in the same order.
+Each entry is "SAFE" or "UNSAFE: <comma-separated categories from: hate, violence, sexual, terrorism, self-harm, other>".
+"""
+
+REWRITE_SYS = """
+You are a moderation agent for LinkedIn posts.
+The post you receive was flagged as UNSAFE.
+
+Rules:
+- Rewrite the text into a safe, professional LinkedIn post.
+- If it is not remotely related to any field, return a message to tell user to not make NSFW posts.
+- Do not add explanations, metadata, or JSON. Only return the final post text.
+"""
+
+# One client per system prompt, built on first use and reused afterwards
+_models: Dict[str, Any] = {}
+_models_lock = threading.Lock()
+
+
+def _get_model(system_prompt: str) -> Any:
+    with _models_lock:
+        model = _models.get(system_prompt)
+        if model is None:
+            # The Gemini SDK is slow to import; load and configure it only once a
+            # post actually needs the LLM (the local prefilter decides most).
+            import google.generativeai as genai
+
+            if not _models:
+                if settings.gemini_api_base:
+                    genai.configure(
+                        api_key=settings.gemini_key,
+                        transport="rest",
+                        client_options={"api_endpoint": settings.gemini_api_base},
+                    )
+                else:
+                    genai.configure(api_key=settings.gemini_key)
+            model = genai.GenerativeModel(MODERATION_MODEL, system_instruction=system_prompt)
+            _models[system_prompt] = model
+        return model
+
+
+def _unwrap(text) -> str:
+    # Unwrap dict if needed
+    if isinstance(text, dict) and "post" in text:
+        return text["post"]
+    return text
+
+
+_verdict_cache: "OrderedDict[str, Dict]" = OrderedDict()
+_verdict_lock = threading.Lock()
+
+
+def _cache_key(text: str) -> str:
+    normalized = re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def _cache_get(key: str) -> Dict | None:
+    with _verdict_lock:
+        verdict = _verdict_cache.get(key)
+        if verdict is not None:
+            _verdict_cache.move_to_end(key)
+        return verdict
+
+
+def _cache_put(key: str, verdict: Dict) -> None:
+    with _verdict_lock:
+        _verdict_cache[key] = verdict
+        _verdict_cache.move_to_end(key)
+        while len(_verdict_cache) > VERDICT_CACHE_SIZE:
+            _verdict_cache.popitem(last=False)
+
+
+_matchers: Dict[str, object] = {}
+_matchers_lock = threading.Lock()
+
+_tier_counts: Counter = Counter()
+_tier_lock = threading.Lock()
+
+
+def _record_tier(tier: str) -> None:
+    with _tier_lock:
+        _tier_counts[tier] += 1
+    metrics.incr("moderation_verdicts", tier=tier)
+
+
+def _get_matchers() -> Dict[str, object]:
+    with _matchers_lock:
+        if not _matchers:
+            unsafe = {c: list(terms) for c, terms in UNSAFE_TERMS.items()}
+            sensitive = list(SENSITIVE_TERMS)
+            safe = list(SAFE_TERMS)
+
+            if settings.moderation_terms_path:
+                with open(settings.moderation_terms_path, encoding="utf-8") as f:
+                    extra = json.load(f)
+                for category, terms in (extra.get("unsafe") or {}).items():
+                    unsafe.setdefault(category, []).extend(terms)
+                sensitive.extend(extra.get("sensitive") or [])
+                safe.extend(extra.get("safe") or [])
+
+            _matchers["categories"] = {t.lower(): c for c, terms in unsafe.items() for t in terms}
+            _matchers["unsafe"] = TermMatcher(_matchers["categories"])
+            _matchers["sensitive"] = TermMatcher(sensitive)
+            _matchers["safe"] = TermMatcher(safe)
+        return _matchers
+
+
+def prefilter(text) -> Dict:
+    """
+    Local first-stage classifier, no network involved.
+    Returns {"label": "SAFE" | "UNSURE", "categories": [...], "reasons": [...]};
+    categories are hints from unsafe-term hits. Only UNSURE text needs the LLM.
+    """
+    text = _unwrap(text)
+    matchers = _get_matchers()
+
+    hits = matchers["unsafe"].find(text)
+    categories = sorted({matchers["categories"][term] for _, term in hits})
+    reasons = sorted({t for _, t in hits} | {t for _, t in matchers["sensitive"].find(text)})
+
+    letters = [ch for ch in text if ch.isalpha()]
+    if letters:
+        latin = sum(1 for ch in letters if ch.isascii())
+        if latin / len(letters) < PREFILTER_MIN_LATIN_RATIO:
+            reasons.append("non-latin script")
+        upper = sum(1 for ch in letters if ch.isupper())
+        if len(letters) >= 40 and upper / len(letters) > PREFILTER_MAX_CAPS_RATIO:
+            reasons.append("shouting")
+    if reasons:
+        return {"label": "UNSURE", "categories": categories, "reasons": reasons}
+
+    # No red flags isn't enough: require professional vocabulary as evidence
+    safe_hits = [term for _, term in matchers["safe"].find(text)]
+    words = len(re.findall(r"\w+", text))
+    density = len(safe_hits) / words if words else 0.0
+    if len(set(safe_hits)) < settings.moderation_safe_min_hits or density < settings.moderation_safe_min_density:
+        return {"label": "UNSURE", "categories": [], "reasons": ["too little evidence of safe content"]}
+    return {"label": "SAFE", "categories": [], "reasons": []}
+
+
+def tier_stats() -> Dict:
+    """
+    How often each tier decided a verdict: cache, local_safe or llm
+    (also exported as the moderation_verdicts{tier} counter).
+    """
+    with _tier_lock:
+        counts = dict(_tier_counts)
+    total = sum(counts.values())
+    return {
+        "counts": counts,
+        "total": total,
+        "rates": {tier: round(n / total, 4) for tier, n in counts.items()} if total else {},
+    }
+
+
+def _local_verdict(text: str, key: str) -> Dict | None:
+    """
+    Caches and returns a local SAFE verdict if the prefilter is sure, else None.
+    """
+    if not settings.moderation_prefilter:
+        return None
+
+    result = prefilter(text)
+    if result["label"] != "SAFE":
+        return None
+
+    _record_tier("local_safe")
+    verdict = {"label": "SAFE", "categories": []}
+    _cache_put(key, verdict)
+    return verdict
+
+
+def _parse_verdict(raw: str) -> Dict | None:
+    """
+    Parses "SAFE" / "UNSAFE: hate, violence" into {"label": ..., "categories": [...]}.
+    Returns None for anything else.
+    """
+    line = (raw or "").strip().strip("`\"'").strip()
+    label, _, rest = line.partition(":")
+    label = label.strip().upper()
+
+    if label == "SAFE":
+        return {"label": "SAFE", "categories": []}
+    if label == "UNSAFE":
+        categories = [c.strip().lower() for c in rest.split(",") if c.strip()]
+        return {"label": "UNSAFE", "categories": categories or ["other"]}
+    return None
+
+
+def _record(response, prompt: List[str]) -> None:
+    reply = ""
+    if response and response.candidates:
+        reply = response.candidates[0].content.parts[0].text
+    cost.record_usage(
+        MODERATION_MODEL,
+        getattr(response, "usage_metadata", None),
+        prompt="\n".join(prompt),
+        completion=reply,
+    )
+
+
+def _generate(system_prompt: str, text: str) -> str | None:
+    response = ratelimit.call(
+        MODERATION_MODEL,
+        lambda: _get_model(system_prompt).generate_content(
+            [{"role": "user", "parts": [text]}],
+            generation_config={"temperature": 0.2},
+        ),
+        tokens=len(text) // 2,
+    )
+    _record(response, [system_prompt, text])
+
+    # Extract the plain text response
+    if response and response.candidates:
+        return response.candidates[0].content.parts[0].text.strip()
+    return None
+
+
+def _verdict(text: str) -> Dict:
+    key = _cache_key(text)
+
+    verdict = _cache_get(key)
+    if verdict is not None:
+        _record_tier("cache")
+        return verdict
+
+    verdict = _local_verdict(text, key)
+    if verdict is not None:
+        return verdict
+
+    verdict = _parse_verdict(_generate(VERDICT_SYS, text) or "")
+    if verdict is None:
+        raise RuntimeError("Moderation returned an invalid verdict")
+
+    _record_tier("llm")
+    _cache_put(key, verdict)
+    return verdict
+
+
+def classify_post(text) -> Dict:
+    """
+    Returns a compact verdict for a post without regenerating it:
+    {"label": "SAFE" | "UNSAFE", "categories": [...]}
+    Verdicts are cached by a hash of the normalized text.
+    Raises RuntimeError if the model reply is not a valid verdict.
+    """
+    verdict = _verdict(_unwrap(text))
+    return {"label": verdict["label"], "categories": list(verdict["categories"])}
+
+
+def cached_verdict(text) -> Dict | None:
+    """
+    The verdict already known for a post, without any model call; None if unseen.
+    """
+    verdict = _cache_get(_cache_key(_unwrap(text)))
+    if verdict is None:
+        return None
+    return {"label": verdict["label"], "categories": list(verdict["categories"])}
+
+
+def _resolve(text: str, verdict: Dict) -> str:
+    """
+    Turns a verdict into the final post text, asking for a rewrite only if UNSAFE.
+    Rewrites are stored alongside the cached verdict.
+    """
+    if verdict["label"] == "SAFE":
+        return text
+
+    if verdict.get("rewrite"):
+        return verdict["rewrite"]
+
+    rewrite = _generate(REWRITE_SYS, text)
+    if not rewrite:
+        return "Not Safe to post"
+
+    _cache_put(_cache_key(text), {**verdict, "rewrite": rewrite})
+    return rewrite
+
+
+@tracing.traced("moderation.post")
+def moderate_post(text, verdict_only: bool = True) -> str:
     """
     Moderates a LinkedIn post using Gemini directly.
     Returns only the post if safe, otherwise rewritten safe text.
     Accepts either a raw string or a dict {"post": "..."}.
+
+    With verdict_only (the default) the model only returns a SAFE/UNSAFE label,
+    and a rewrite is requested only for unsafe posts. Otherwise the legacy
+    protocol is used, where the model echoes safe posts back in full.
     """
-    # Unwrap dict if needed
-    if isinstance(text, dict) and "post" in text:
-        text = text["post"]
+    text = _unwrap(text)
 
     try:
-        response = genai.GenerativeModel(MODERATION_MODEL).generate_content(
-            [
-                {"role": "system", "parts": [GUARDRAIL_SYS]},
-                {"role": "user", "parts": [text]},
-            ],
-            generation_config={"temperature": 0.2},
-        )
+        if not verdict_only:
+            return _generate(GUARDRAIL_SYS, text) or "Not Safe to post"
 
-        # Extract the plain text response
-        if response and response.candidates:
-            return response.candidates[0].content.parts[0].text.strip()
+        return _resolve(text, _verdict(text))
 
+    except Exception:
         return "Not Safe to post"
 
+
+def _batch_request(system_prompt: str, texts: List[str]) -> List[str] | None:
+    """
+    Sends all posts in one structured request.
+    Returns None if the reply cannot be matched back to the inputs.
+    """
+    try:
+        payload = json.dumps(texts)
+        response = ratelimit.call(
+            MODERATION_MODEL,
+            lambda: _get_model(system_prompt).generate_content(
+                [{"role": "user", "parts": [payload]}],
+                generation_config={"temperature": 0.2, "response_mime_type": "application/json"},
+            ),
+            tokens=len(payload) // 2,
+        )
+        _record(response, [system_prompt, payload])
+        if not (response and response.candidates):
+            return None
+
+        items = parse_json(response.candidates[0].content.parts[0].text, list, source="moderation")
+    except Exception:
+        return None
+
+    if not isinstance(items, list) or len(items) != len(texts):
+        return None
+    if not all(isinstance(v, str) for v in items):
+        return None
+
+    return [v.strip() for v in items]
+
+
+def _moderate_batch(texts: List[str], verdict_only: bool) -> List[str] | None:
+    if not verdict_only:
+        return _batch_request(GUARDRAIL_BATCH_SYS, texts)
+
+    # Only send posts to the LLM that are neither cached nor decided locally
+    pending = []
+    for text in dict.fromkeys(texts):
+        key = _cache_key(text)
+        if _cache_get(key) is not None:
+            _record_tier("cache")
+        elif _local_verdict(text, key) is None:
+            pending.append(text)
+
+    if pending:
+        labels = _batch_request(VERDICT_BATCH_SYS, pending)
+        if labels is None:
+            return None
+
+        verdicts = [_parse_verdict(label) for label in labels]
+        if any(v is None for v in verdicts):
+            return None
+
+        for text, verdict in zip(pending, verdicts):
+            _record_tier("llm")
+            _cache_put(_cache_key(text), verdict)
+
+    return _moderate_concurrent(texts, _finalize)
+
+
+def _finalize(text: str) -> str:
+    # Every verdict is cached by now; this only fetches rewrites for unsafe posts
+    try:
+        return _resolve(text, _cache_get(_cache_key(text)) or _verdict(text))
     except Exception:
         return "Not Safe to post"
 
 
+def _moderate_concurrent(texts: List[str], fn) -> List[str]:
+    workers = max(1, min(len(texts), settings.concurrency))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Each worker gets a copy of the caller's context (usage ledger, stage)
+        futures = [pool.submit(contextvars.copy_context().run, fn, t) for t in texts]
+        return [f.result() for f in futures]
+
+
+@tracing.traced("moderation.batch")
+def moderate_posts(texts: List, verdict_only: bool = True) -> List[str]:
+    """
+    Moderates several posts at once, returning one result per input in order.
+    Small batches go to Gemini as a single structured request; larger ones
+    (or a batch whose reply can't be parsed) run as concurrent per-post calls
+    on the shared model client. In verdict_only mode only uncached posts are
+    classified, and only unsafe ones are rewritten.
+    """
+    texts = [_unwrap(t) for t in texts]
+
+    if not texts:
+        return []
+    if len(texts) == 1:
+        return [moderate_post(texts[0], verdict_only)]
+
+    if len(texts) <= MODERATION_BATCH_LIMIT:
+        results = _moderate_batch(texts, verdict_only)
+        if results is not None:
+            return results
+
+    return _moderate_concurrent(texts, lambda t: moderate_post(t, verdict_only))
+
+
 if __name__ == "__main__":
     safe = {"post": "AI is transforming the future of healthcare in exciting ways."}
     unsafe = {"post": "This post promotes hate and violence."}
 
     print("Safe test ->", moderate_post(safe))
     print("Unsafe test ->", moderate_post(unsafe))
+    print("Verdict test ->", classify_post(unsafe))
+    print("Prefilter test ->", prefilter(safe), prefilter(unsafe))
+    print("Batch test ->", moderate_posts([safe, unsafe]))
@@ -0,0 +1,153 @@
+# src/utils/prompt.py
+"""
+Token-budgeted prompt construction: measures each prompt component with
+tiktoken, serializes plans compactly and trims news context to fit the budget.
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.config import settings
+from src.llm_providers import context_window
+from src.utils import metrics
+from src.utils.cost import count_tokens, get_encoding
+
+# News fields the writer actually uses; urls are long and never quoted in posts
+NEWS_FIELDS = ("title", "source", "desc")
+
+# Below this many tokens a news description isn't worth keeping
+MIN_DESC_TOKENS = 12
+
+# Overhead per chat message (role markers etc.)
+MESSAGE_OVERHEAD = 4
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """
+    Cuts text to at most max_tokens, preferring a sentence or word boundary.
+    """
+    text = (text or "").strip()
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    encoding = get_encoding()
+    if encoding is not None:
+        cut = encoding.decode(encoding.encode(text, disallowed_special=())[: max_tokens - 1])
+    else:
+        cut = text[: (max_tokens - 1) * 4]
+
+    sentence = max(cut.rfind(". "), cut.rfind("! "), cut.rfind("? "))
+    if sentence > len(cut) // 2:
+        return cut[: sentence + 1]
+    word = cut.rfind(" ")
+    if word > len(cut) // 2:
+        cut = cut[:word]
+    return cut.rstrip(" ,;:-") + "…"
+
+
+def compact_plan(plan: Dict[str, Any]) -> str:
+    """
+    Minimal JSON for a plan: no whitespace, no empty or null fields.
+    """
+    cleaned = {k: v for k, v in plan.items() if v not in (None, "", [], {})}
+    return json.dumps(cleaned, separators=(",", ":"), ensure_ascii=False)
+
+
+def _compact_news(news: List[Dict], desc_tokens: Optional[int]) -> List[Dict]:
+    items = []
+    for article in news:
+        item = {k: article.get(k) for k in NEWS_FIELDS if article.get(k)}
+        if "desc" in item:
+            # Strip NewsAPI's "[+1234 chars]" tails and collapse whitespace
+            desc = re.sub(r"\s*\[\+\d+ chars\]\s*$", "", re.sub(r"\s+", " ", item["desc"]))
+            if desc_tokens is not None:
+                desc = truncate_tokens(desc, desc_tokens) if desc_tokens >= MIN_DESC_TOKENS else ""
+            if desc:
+                item["desc"] = desc
+            else:
+                del item["desc"]
+        if item:
+            items.append(item)
+    return items
+
+
+def _payload(plan: Dict, news: List[Dict]) -> str:
+    return compact_plan({**plan, "news": news} if news else plan)
+
+
+def build_messages(
+    system: str,
+    plan: Dict[str, Any],
+    news: Optional[List[Dict]] = None,
+    budget: Optional[int] = None,
+    record: bool = True,
+    model: Optional[str] = None,
+    max_tokens: Optional[int] = None,
+) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+    """
+    Builds [system, user] messages for a plan (plus optional news) within an
+    input-token budget (default PROMPT_TOKEN_BUDGET), never more than the
+    model's context window minus `max_tokens` (default MAX_TOKENS) left for
+    the reply. News descriptions are trimmed first, then whole articles are
+    dropped from the end.
+
+    Returns (messages, report) where report holds the token count per component,
+    the total, the naive json.dumps size and the tokens saved.
+    With record=False (e.g. for a cost estimate) the prompt_tokens metrics are left alone.
+    """
+    budget = budget or settings.prompt_token_budget
+    window = context_window(model or settings.model_name)
+    if window:
+        budget = max(0, min(budget, window - (max_tokens or settings.max_tokens)))
+    news = news or []
+
+    system_tokens = count_tokens(system) + MESSAGE_OVERHEAD
+    plan_only = compact_plan(plan)
+    plan_tokens = count_tokens(plan_only) + MESSAGE_OVERHEAD
+    available = budget - system_tokens - plan_tokens
+
+    # Articles with nothing usable are dropped up front, so `usable[:count]`
+    # always lines up with what's kept
+    usable = [a for a in news if _compact_news([a], None)]
+    count = len(usable)
+    kept = _compact_news(usable, None)
+    if kept:
+        # Shrink descriptions evenly until the news block fits, then drop articles
+        desc_tokens = max(count_tokens(a.get("desc", "")) for a in kept)
+        limit: Optional[int] = None
+        while kept and count_tokens(json.dumps(kept, separators=(",", ":"), ensure_ascii=False)) > available:
+            if desc_tokens >= MIN_DESC_TOKENS:
+                desc_tokens = limit = desc_tokens * 2 // 3
+            else:
+                count -= 1
+            kept = _compact_news(usable[:count], limit)
+
+    user = _payload(plan, kept)
+    messages = [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user},
+    ]
+
+    total = system_tokens + count_tokens(user) + MESSAGE_OVERHEAD
+    naive = system_tokens + count_tokens(json.dumps({**plan, "news": news} if news else plan)) + MESSAGE_OVERHEAD
+    report = {
+        "budget": budget,
+        "tokens": total,
+        "components": {
+            "system": system_tokens,
+            "plan": plan_tokens,
+            "news": total - system_tokens - plan_tokens,
+        },
+        "naive_tokens": naive,
+        "saved_tokens": max(0, naive - total),
+        "news_kept": len(kept),
+        "news_dropped": len(news) - len(kept),
+        "over_budget": total > budget,
+    }
+    if record:
+        metrics.observe("prompt_tokens", total)
+        metrics.observe("prompt_tokens_saved", report["saved_tokens"])
+    return messages, report
@@ -0,0 +1,284 @@
+# src/utils/ratelimit.py
+"""
+Process-wide rate limiting for provider calls:
+- token buckets per provider/model for requests/min and tokens/min,
+- AIMD concurrency that backs off on throttling and creeps back up on success,
+- retries with jittered exponential backoff that honor Retry-After.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from src.config import settings
+from src.utils import metrics
+
+# (requests/min, tokens/min) per model; free-tier Google AI Studio quotas.
+# LLM_RPM / LLM_TPM override these for every model.
+DEFAULT_LIMITS: Dict[str, Tuple[float, float]] = {
+    "gemini-1.5-flash": (15, 1_000_000),
+    "gemini-1.5-flash-8b": (15, 1_000_000),
+    "gemini-1.5-pro": (2, 32_000),
+}
+FALLBACK_LIMITS = (60, 1_000_000)
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {
+    "RateLimitError", "Timeout", "APIConnectionError", "ServiceUnavailableError",
+    "InternalServerError", "ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded",
+    "TooManyRequests",
+}
+
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30.0
+
+
+class TokenBucket:
+    """
+    Refills `per_minute` units per minute up to one minute's worth.
+    reserve() never blocks: it books the units and returns how long the caller
+    must wait before using them, so concurrent callers queue up fairly.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float = 1.0) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= min(amount, self.capacity)
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def adjust(self, amount: float) -> None:
+        """
+        Corrects an earlier reservation once the real cost is known
+        (positive = consumed more than reserved).
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= amount
+
+    def headroom(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, self._tokens) / self.capacity
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on in-flight calls: +1 per window of successes, halved on throttling.
+    """
+
+    def __init__(self, initial: float, maximum: float, minimum: float = 1.0):
+        self.limit = float(initial)
+        self.minimum = float(minimum)
+        self.maximum = float(maximum)
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    async def aacquire(self) -> None:
+        while not self.try_acquire():
+            await asyncio.sleep(0.05)
+
+    def release(self, throttled: bool = False) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit / 2)
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+
+class ProviderLimiter:
+    def __init__(self, rpm: float, tpm: float, concurrency: int):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.concurrency = AdaptiveConcurrency(initial=concurrency, maximum=max(concurrency, rpm))
+
+    def reserve(self, tokens: float) -> float:
+        return max(self.requests.reserve(1), self.tokens.reserve(tokens))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "concurrency_limit": round(self.concurrency.limit, 2),
+            "in_flight": self.concurrency.in_flight,
+            "request_headroom": round(self.requests.headroom(), 3),
+            "token_headroom": round(self.tokens.headroom(), 3),
+        }
+
+
+_limiters: Dict[str, ProviderLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(model: str) -> ProviderLimiter:
+    """
+    Returns the shared limiter for a provider/model, creating it on first use.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(model)
+        if limiter is None:
+            rpm, tpm = DEFAULT_LIMITS.get(model.split("/")[-1], FALLBACK_LIMITS)
+            limiter = ProviderLimiter(
+                rpm=settings.llm_rpm or rpm,
+                tpm=settings.llm_tpm or tpm,
+                concurrency=settings.concurrency * 2,
+            )
+            _limiters[model] = limiter
+        return limiter
+
+
+def limiter_stats() -> Dict[str, Dict[str, float]]:
+    with _limiters_lock:
+        return {model: limiter.stats() for model, limiter in _limiters.items()}
+
+
+def is_retryable(error: BaseException) -> bool:
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if isinstance(status, int) and status in RETRYABLE_STATUS:
+        return True
+    return type(error).__name__ in RETRYABLE_ERRORS
+
+
+def is_throttle(error: BaseException) -> bool:
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    return status == 429 or type(error).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests")
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """
+    Seconds the provider asked us to wait, if it said so.
+    """
+    value = getattr(error, "retry_after", None)
+    if value is None:
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        try:
+            value = headers.get("retry-after") or headers.get("Retry-After")
+        except AttributeError:
+            value = None
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt: int, error: BaseException) -> float:
+    hinted = retry_after(error)
+    if hinted is not None:
+        # A provider asking for minutes shouldn't park the request that long
+        return min(BACKOFF_CAP, hinted) + random.uniform(0, BACKOFF_BASE)
+    # Full jitter keeps concurrent retries from synchronizing
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def call(
+    model: str,
+    fn: Callable[[], Any],
+    *,
+    tokens: float,
+    used_tokens: Optional[Callable[[Any], Optional[float]]] = None,
+    retry_throttles: bool = True,
+) -> Any:
+    """
+    Runs fn() under the model's limiter, retrying retryable errors.
+    `tokens` is the up-front estimate; `used_tokens(result)` may report the real count.
+    With retry_throttles=False a 429 is raised at once (the caller has a
+    fallback model to try instead of waiting).
+    """
+    limiter = get_limiter(model)
+    attempts = max(1, settings.llm_max_retries + 1)
+
+    for attempt in range(attempts):
+        limiter.concurrency.acquire()
+        throttled = False
+        try:
+            wait = limiter.reserve(tokens)
+            if wait:
+                time.sleep(wait)
+            result = fn()
+        except Exception as e:
+            throttled = is_throttle(e)
+            if attempt + 1 >= attempts or not is_retryable(e) or (throttled and not retry_throttles):
+                raise
+            delay = backoff(attempt, e)
+            metrics.incr("llm_retries", model=model, reason="throttle" if throttled else "error")
+        else:
+            _settle(limiter, tokens, used_tokens, result)
+            return result
+        finally:
+            limiter.concurrency.release(throttled)
+
+        time.sleep(delay)
+
+
+async def acall(
+    model: str,
+    fn: Callable[[], Awaitable[Any]],
+    *,
+    tokens: float,
+    used_tokens: Optional[Callable[[Any], Optional[float]]] = None,
+    retry_throttles: bool = True,
+) -> Any:
+    """
+    Async variant of call().
+    """
+    limiter = get_limiter(model)
+    attempts = max(1, settings.llm_max_retries + 1)
+
+    for attempt in range(attempts):
+        await limiter.concurrency.aacquire()
+        throttled = False
+        try:
+            wait = limiter.reserve(tokens)
+            if wait:
+                await asyncio.sleep(wait)
+            result = await fn()
+        except Exception as e:
+            throttled = is_throttle(e)
+            if attempt + 1 >= attempts or not is_retryable(e) or (throttled and not retry_throttles):
+                raise
+            delay = backoff(attempt, e)
+            metrics.incr("llm_retries", model=model, reason="throttle" if throttled else "error")
+        else:
+            _settle(limiter, tokens, used_tokens, result)
+            return result
+        finally:
+            limiter.concurrency.release(throttled)
+
+        await asyncio.sleep(delay)
+
+
+def _settle(limiter: ProviderLimiter, estimate: float, used_tokens, result: Any) -> None:
+    if used_tokens is None:
+        return
+    try:
+        actual = used_tokens(result)
+    except Exception:
+        return
+    if actual:
+        limiter.tokens.adjust(actual - estimate)
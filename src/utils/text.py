@@ -1,34 +1,153 @@
-import re
+# src/utils/text.py
+"""
+Tolerant JSON extraction from LLM replies, shared by the agents.
+
+extract_json() makes a single pass over the reply: it skips code fences and
+prose up to the first "{" or "[", drops trailing commas, and when the reply
+is cut off (max_tokens) closes whatever is still open. parse_json() wraps it
+with per-caller "json_parsed" / "json_repaired" / "json_failed" counters.
+"""
+
 import json
+import re
+from typing import Any, List, Optional, Tuple
+
+from src.utils import metrics
+
+_CLOSERS = {"{": "}", "[": "]"}
+_FENCE = re.compile(r"```(?:json)?", re.IGNORECASE)
+
+
+def _close(chars: List[str], stack: List[str]) -> str:
+    text = "".join(chars).rstrip()
+    # A dangling comma or key separator can't be closed
+    while text and text[-1] in ",:":
+        text = text[:-1].rstrip()
+    return text + "".join(_CLOSERS[c] for c in reversed(stack))
+
+
+def _loads(text: str) -> Tuple[bool, Any]:
+    try:
+        return True, json.loads(text)
+    except json.JSONDecodeError:
+        return False, None
+
+
+def _scan(raw: str, expect: Optional[type], keep_partial: bool) -> Tuple[Any, bool]:
+    """
+    (value, repaired); value is None if nothing usable was found.
+    """
+    openers = {dict: "{", list: "["}.get(expect, "{[")
+    start = next((i for i, c in enumerate(raw) if c in openers), -1)
+    if start == -1:
+        return None, False
+
+    chars: List[str] = []
+    stack: List[str] = []
+    in_string = escaped = repaired = False
+    # Last point where everything so far is complete: (length of chars, open containers)
+    safe: Tuple[int, List[str]] = (0, [])
+
+    for c in raw[start:]:
+        if in_string:
+            chars.append(c)
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == '"':
+                in_string = False
+            elif c in "\n\r\t":
+                # Raw control characters are invalid inside JSON strings
+                chars[-1] = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}[c]
+                repaired = True
+            continue
+
+        if c == '"':
+            in_string = True
+        elif c in _CLOSERS:
+            stack.append(c)
+        elif c in "}]":
+            # Trailing comma before a closer
+            while chars and chars[-1].isspace():
+                chars.pop()
+            if chars and chars[-1] == ",":
+                chars.pop()
+                repaired = True
+            if not stack or _CLOSERS[stack[-1]] != c:
+                break
+            stack.pop()
+            chars.append(c)
+            if not stack:
+                ok, value = _loads("".join(chars))
+                return (value, repaired) if ok else (None, False)
+            safe = (len(chars), list(stack))
+            continue
+        elif c == ",":
+            safe = (len(chars), list(stack))
+        chars.append(c)
+        if c in _CLOSERS:
+            safe = (len(chars), list(stack))
+
+    # Cut off mid-value: close the open string (if keep_partial) and containers,
+    # otherwise fall back to the last complete item
+    attempts = []
+    if keep_partial and in_string:
+        attempts.append(_close(chars + (["\\"] if escaped else []) + ['"'], stack))
+    if not in_string:
+        attempts.append(_close(chars, stack))
+    attempts.append(_close(chars[:safe[0]], safe[1]))
+    for text in attempts:
+        ok, value = _loads(text)
+        if ok:
+            return value, True
+    return None, False
+
+
+def extract_json(raw: str, expect: Optional[type] = None, keep_partial: bool = True) -> Any:
+    """
+    The first JSON object or array in `raw` (only objects with expect=dict,
+    only arrays with expect=list), or None.
+    With keep_partial=False a string cut off mid-way is dropped rather than closed.
+    """
+    if not raw:
+        return None
+    value, _ = _scan(raw, expect, keep_partial)
+    if expect is not None and not isinstance(value, expect):
+        return None
+    return value
+
+
+def parse_json(raw: str, expect: Optional[type] = None, *, source: str = "other",
+               keep_partial: bool = True) -> Any:
+    """
+    extract_json() that counts the outcome per `source` (planner, writer, ...).
+    """
+    value, repaired = _scan(raw, expect, keep_partial) if raw else (None, False)
+    if value is None or (expect is not None and not isinstance(value, expect)):
+        metrics.incr("json_failed", source=source)
+        return None
+    metrics.incr("json_repaired" if repaired else "json_parsed", source=source)
+    return value
+
 
 def clean_text(raw: str) -> str:
     """
     Extracts and returns only the post text from a JSON-wrapped string.
-    
+
     Example input:
     '```json { "post": "Hello world!" } ```'
-    
+
     Returns:
     'Hello world!'
     """
     if not raw:
         return ""
 
-    # Remove markdown fences like ```json ... ```
-    cleaned = re.sub(r"```(?:json)?", "", raw, flags=re.IGNORECASE).strip("` \n")
-
-    try:
-        # Parse JSON if it's valid
-        data = json.loads(cleaned)
-        if isinstance(data, dict) and "post" in data:
+    if '"post"' in raw:
+        data = extract_json(raw, dict)
+        if isinstance(data, dict) and isinstance(data.get("post"), str):
             return data["post"].strip()
-    except Exception:
-        pass
-
-    # Fallback: try regex to capture post inside { "post": "..." }
-    match = re.search(r'\"post\"\s*:\s*\"(.*)\"', cleaned, re.DOTALL)
-    if match:
-        return match.group(1).encode("utf-8").decode("unicode_escape").strip()
 
-    # If nothing worked, just return the raw cleaned string
-    return cleaned.strip()
+    # Plain text: just drop markdown fences
+    return _FENCE.sub("", raw).strip("` \n")
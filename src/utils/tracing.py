@@ -0,0 +1,160 @@
+# src/utils/tracing.py
+"""
+Lightweight tracing: nested timing spans that share one request ID (the trace
+ID of the outermost span). Each finished span feeds the "span_seconds"
+histogram and, if TRACE_LOG is set, is appended to that file as one
+OpenTelemetry-style JSON line.
+
+Off unless TRACING=true (or TRACE_LOG is set); when off, span() is a no-op.
+
+    with tracing.span("pipeline", topic=topic) as root:
+        ...                      # nested spans inherit root.trace_id
+"""
+
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from src.config import settings
+from src.utils import metrics
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    start_ns: int = 0
+    end_ns: int = 0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def to_otel(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "attributes": [
+                {"key": k, "value": {"stringValue": str(v)}} for k, v in self.attributes.items()
+            ],
+            "status": (
+                {"code": "STATUS_CODE_ERROR", "message": self.error}
+                if self.error else {"code": "STATUS_CODE_OK"}
+            ),
+        }
+
+
+class _NoopSpan:
+    trace_id = None
+    span_id = None
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+_current: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+
+_log_lock = threading.Lock()
+_log_file = None
+
+
+def enabled() -> bool:
+    return settings.tracing_enabled or bool(settings.trace_log)
+
+
+def current() -> Optional[Span]:
+    return _current.get()
+
+
+def request_id() -> Optional[str]:
+    """
+    The trace ID of the active request, if tracing is on.
+    """
+    span = _current.get()
+    return span.trace_id if span else None
+
+
+def _write(span: Span) -> None:
+    global _log_file
+
+    path = settings.trace_log
+    if not path:
+        return
+    line = json.dumps(span.to_otel(), default=str)
+    with _log_lock:
+        if _log_file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            _log_file = open(path, "a", encoding="utf-8", buffering=1)
+        _log_file.write(line + "\n")
+
+
+@contextmanager
+def span(name: str, *, attach: bool = True, **attributes: Any) -> Iterator[Any]:
+    """
+    Times the block as a child of the active span (or a new trace).
+    With attach=False the span doesn't become the parent of spans opened
+    inside the block, which is needed around generators that yield mid-span.
+    """
+    if not enabled():
+        yield _NOOP
+        return
+
+    parent = _current.get()
+    s = Span(
+        name=name,
+        trace_id=parent.trace_id if parent else os.urandom(16).hex(),
+        span_id=os.urandom(8).hex(),
+        parent_id=parent.span_id if parent else None,
+        start_ns=time.time_ns(),
+        attributes=attributes,
+    )
+    token = _current.set(s) if attach else None
+    started = time.perf_counter()
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        metrics.incr("span_errors", span=name)
+        raise
+    finally:
+        if token is not None:
+            _current.reset(token)
+        s.end_ns = time.time_ns()
+        metrics.observe("span_seconds", time.perf_counter() - started, span=name)
+        _write(s)
+
+
+def traced(name: str) -> Callable:
+    """
+    Decorator form of span() for plain and async functions.
+    """
+    def decorate(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorate